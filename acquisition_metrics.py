@@ -0,0 +1,158 @@
+"""
+Timing statistics of the acquisition loop in log_pumping_curve.py.
+
+Each GaugeLogger keeps an AcquisitionMetrics with latency histograms
+of the stages of its loop (gauge read, evaluation of the new sample,
+file writes, sleep), the actual sampling intervals, how late the
+scheduler woke up for each tick (jitter), skipped ticks and
+GaugeErrors. write_prometheus() exports them in the Prometheus text
+exposition format, summary() gives a short report.
+"""
+
+import bisect
+import os
+import tempfile
+
+# upper bounds in seconds, from 100 us to 100 s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1., 2.5, 5., 10., 25., 50., 100.)
+
+STAGES = ('read', 'evaluate', 'write', 'sleep')
+
+class Histogram:
+    """ counts of observations per bucket like a Prometheus histogram, plus the maximum """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else float('nan')
+
+    def quantile(self, q):
+        """ upper bound of the bucket holding the q-quantile (the maximum for the last bucket) """
+        if not self.count:
+            return float('nan')
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative_counts(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield bound, cumulative
+
+class AcquisitionMetrics:
+
+    def __init__(self, plugin, identifier='', sampling_interval=None):
+        self.labels = {'gauge': plugin, 'identifier': identifier}
+        self.sampling_interval = sampling_interval
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.intervals = Histogram()
+        self.jitter = Histogram()
+        self.skipped_ticks = 0
+        self.samples = 0
+        self.gauge_errors = 0
+        self.late_samples = 0
+        # total time spent writing, to tell it apart from the evaluation around it
+        self.write_seconds = 0.
+
+    def observe(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+        if stage == 'write':
+            self.write_seconds += seconds
+
+    def observe_tick(self, jitter, skipped_ticks=0):
+        self.jitter.observe(max(jitter, 0.))
+        self.skipped_ticks += skipped_ticks
+
+    def observe_interval(self, seconds):
+        """ the time from the previous gauge read to this one """
+        self.intervals.observe(seconds)
+        if self.sampling_interval and seconds > 1.1 * self.sampling_interval:
+            self.late_samples += 1
+
+    def summary(self):
+        name = self.labels['gauge'] + (' ' + self.labels['identifier'] if self.labels['identifier'] else '')
+        lines = [f"{name}: {self.samples} samples, {self.gauge_errors} gauge errors, "
+                 f"{self.late_samples} late samples, {self.skipped_ticks} skipped ticks"]
+        if self.intervals.count:
+            lines.append(f"  interval: requested {self.sampling_interval:.4g} s, actual mean {self.intervals.mean:.4g} s, "
+                         f"p99 <= {self.intervals.quantile(0.99):.4g} s, max {self.intervals.max:.4g} s")
+        for stage, histogram in list(self.stages.items()) + [('jitter', self.jitter)]:
+            if histogram.count:
+                lines.append(f"  {stage:>8s}: mean {histogram.mean * 1000:.3g} ms, p50 <= {histogram.quantile(0.5) * 1000:.3g} ms, "
+                             f"p99 <= {histogram.quantile(0.99) * 1000:.3g} ms, max {histogram.max * 1000:.3g} ms")
+        return '\n'.join(lines)
+
+def _format_labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _histogram_lines(name, labels, histogram):
+    for bound, cumulative in histogram.cumulative_counts():
+        yield f"{name}_bucket{_format_labels(dict(labels, le=_format_value(bound)))} {cumulative}"
+    yield f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}"
+    yield f"{name}_count{_format_labels(labels)} {histogram.count}"
+
+def prometheus_text(all_metrics):
+    """ the metrics of all loggers in the Prometheus text exposition format """
+    lines = [
+        '# HELP vacuum_logger_stage_seconds Time spent per stage of the acquisition loop.',
+        '# TYPE vacuum_logger_stage_seconds histogram',
+    ]
+    for metrics in all_metrics:
+        for stage, histogram in metrics.stages.items():
+            lines.extend(_histogram_lines('vacuum_logger_stage_seconds', dict(metrics.labels, stage=stage), histogram))
+    lines += [
+        '# HELP vacuum_logger_interval_seconds Actual time between two gauge reads.',
+        '# TYPE vacuum_logger_interval_seconds histogram',
+    ]
+    for metrics in all_metrics:
+        lines.extend(_histogram_lines('vacuum_logger_interval_seconds', metrics.labels, metrics.intervals))
+    lines += [
+        '# HELP vacuum_logger_tick_jitter_seconds Delay between a scheduled tick and the wake-up for it.',
+        '# TYPE vacuum_logger_tick_jitter_seconds histogram',
+    ]
+    for metrics in all_metrics:
+        lines.extend(_histogram_lines('vacuum_logger_tick_jitter_seconds', metrics.labels, metrics.jitter))
+    for name, kind, help_text, attribute in (
+            ('vacuum_logger_requested_interval_seconds', 'gauge', 'Requested sampling interval.', 'sampling_interval'),
+            ('vacuum_logger_samples_total', 'counter', 'Successful gauge reads.', 'samples'),
+            ('vacuum_logger_gauge_errors_total', 'counter', 'Gauge reads failed with a GaugeError and retried.', 'gauge_errors'),
+            ('vacuum_logger_late_samples_total', 'counter', 'Gauge reads more than 10 % later than requested.', 'late_samples'),
+            ('vacuum_logger_skipped_ticks_total', 'counter', 'Ticks dropped because a cycle took too long.', 'skipped_ticks')):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for metrics in all_metrics:
+            lines.append(f"{name}{_format_labels(metrics.labels)} {_format_value(getattr(metrics, attribute))}")
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus(all_metrics, filename):
+    """ replace filename atomically, e.g. for the textfile collector of the node exporter """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_filename = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(prometheus_text(all_metrics))
+    os.chmod(tmp_filename, 0o644)
+    os.replace(tmp_filename, filename)
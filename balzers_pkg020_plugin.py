@@ -1,6 +1,7 @@
+import time
+import numpy as np
 from labjack import ljm
-from balzerspkg020_helpers import interpolate_log_aware
-from balzerspkg020 import tables
+from balzerspkg020_helpers import get_calibration_table
 
 from gauge_plugin import Gauge, GaugeError
 
@@ -8,21 +9,65 @@ class BalzersPkg020(Gauge):
 
     def __init__(self, identifier='', channels=('AIN0',)):
         self.handle = ljm.openS("ANY", "ANY", "ANY")
-        self.selected_channels = channels
+        self.selected_channels = list(channels)
+        self.calibration_table = get_calibration_table('tpr2')
+        self.stream_scan_rate = None
 
     def get_readings(self):
-        pressures = []
-        voltages = []
-        for channel in self.selected_channels:
-            reading = self.get_reading(channel)
-            pressures.append(reading['pressure'])
-            voltages.append(reading['voltage'])
+        """ read all selected channels in a single eReadNames call """
+        try:
+            voltages = ljm.eReadNames(self.handle, len(self.selected_channels), self.selected_channels)
+        except ljm.ljm.LJMError:
+            raise GaugeError()
+        voltages = list(voltages)
+        pressures = [self.calibration_table.convert(voltage) for voltage in voltages]
         return {'pressures': pressures, 'voltages': voltages}
 
     def get_reading(self, channel):
         try:
-            voltage = ljm.eReadName(self.handle, "AIN0")
+            voltage = ljm.eReadName(self.handle, channel)
         except ljm.ljm.LJMError:
             raise GaugeError()
-        pressure = interpolate_log_aware(voltage, tables['tpr2'])
+        pressure = self.calibration_table.convert(voltage)
         return {'pressure': pressure, 'voltage': voltage}
+
+    def start_stream(self, scan_rate=1000., scans_per_read=None):
+        """
+        Start sampling all selected channels at scan_rate Hz into the device buffer.
+        Fetch the data with read_stream(), finish with stop_stream().
+        """
+        scans_per_read = scans_per_read or max(int(scan_rate / 10), 1)
+        n = len(self.selected_channels)
+        try:
+            addresses = ljm.namesToAddresses(n, self.selected_channels)[0]
+            self.stream_scan_rate = ljm.eStreamStart(self.handle, scans_per_read, n, addresses, scan_rate)
+        except ljm.ljm.LJMError:
+            raise GaugeError()
+        self.stream_start = time.time()
+        self.stream_scans = 0
+        return self.stream_scan_rate
+
+    def read_stream(self):
+        """
+        Returns the next block of the stream as {'ts': (scans,),
+        'pressures': (scans, channels), 'voltages': (scans, channels)}.
+        The timestamps are derived from the scan count and the actual scan rate.
+        """
+        try:
+            data, device_backlog, ljm_backlog = ljm.eStreamRead(self.handle)
+        except ljm.ljm.LJMError:
+            raise GaugeError()
+        voltages = np.array(data, dtype=np.float64).reshape(-1, len(self.selected_channels))
+        n_scans = len(voltages)
+        ts = self.stream_start + (self.stream_scans + np.arange(n_scans)) / self.stream_scan_rate
+        self.stream_scans += n_scans
+        pressures = self.calibration_table.convert_many(voltages)
+        return {'ts': ts, 'pressures': pressures, 'voltages': voltages}
+
+    def stop_stream(self):
+        try:
+            ljm.eStreamStop(self.handle)
+        except ljm.ljm.LJMError:
+            raise GaugeError()
+        finally:
+            self.stream_scan_rate = None
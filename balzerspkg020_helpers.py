@@ -1,5 +1,9 @@
 #!/usr/bin/env python
 
+import bisect
+import math
+import os
+
 def interpolate_numpy(value, value_table, exp=True):
     """
     Convert from voltage to pressure using value_table.
@@ -68,12 +72,203 @@ def interpolate_log_aware(value, value_table):
             interp_log_pressure = log_pressure1 + (value - lower_voltage) * dlogpressure/dvoltage
             return math.exp(interp_log_pressure)
 
+class CalibrationTable:
+    """
+    A voltage to pressure lookup table prepared once for repeated conversions.
+
+    Gives the same results as interpolate_log_aware() but keeps the
+    voltage axis and the logarithmized pressures around, so that a
+    scalar conversion is a bisection and a batch conversion is a
+    single np.interp() call.
+    """
+
+    def __init__(self, value_table):
+        self.voltages = [float(row[0]) for row in value_table]
+        self.pressures = [float(row[1]) for row in value_table]
+        self.log_pressures = [math.log(p) for p in self.pressures]
+        self._np_voltages = None
+        self._np_log_pressures = None
+
+    def __len__(self):
+        return len(self.voltages)
+
+    def convert(self, value):
+        """ Convert a single voltage to pressure """
+        voltages = self.voltages
+        # don't extrapolate, return edge value if out of lookup range
+        if value >= voltages[-1]:
+            return self.pressures[-1]
+        if value <= voltages[0]:
+            return self.pressures[0]
+        i = bisect.bisect_left(voltages, value)
+        lower_voltage, upper_voltage = voltages[i-1], voltages[i]
+        log_pressure1, log_pressure2 = self.log_pressures[i-1], self.log_pressures[i]
+        dlogpressure = log_pressure2 - log_pressure1
+        return math.exp(log_pressure1 + (value - lower_voltage) * dlogpressure/(upper_voltage - lower_voltage))
+
+    def convert_many(self, values):
+        """
+        Convert an array of voltages to pressures.
+
+        The array returned by np.interp() is exponentiated in place,
+        so it's the only one allocated.
+        """
+        import numpy as np
+        if self._np_voltages is None:
+            self._np_voltages = np.array(self.voltages)
+            self._np_log_pressures = np.array(self.log_pressures)
+        result = np.interp(values, self._np_voltages, self._np_log_pressures)
+        return np.exp(result, out=result)
+
+_calibration_tables = {}
+
+def get_calibration_table(name):
+    """ Return the (cached) CalibrationTable for an entry of balzerspkg020.tables """
+    if name not in _calibration_tables:
+        from balzerspkg020 import tables
+        _calibration_tables[name] = CalibrationTable(tables[name])
+    return _calibration_tables[name]
+
 # default interpolate function: The numpy version:
 interpolate = interpolate_numpy
 
+def _detect_format(filename):
+    if filename.endswith('.npy'):
+        return 'npy'
+    if filename.endswith(('.csv', '.txt')):
+        return 'csv'
+    return 'raw'
+
+def _is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+def read_voltage_chunks(filename, file_format=None, chunk_size=1 << 20, column=0, delimiter=',', dtype='<f8'):
+    """
+    Yield the voltages stored in filename as float64 arrays of up to
+    chunk_size values. file_format is 'csv' (one column of it), 'npy'
+    (1d, or one column of 2d) or 'raw' (headerless values of dtype),
+    guessed from the extension if not given.
+    """
+    import numpy as np
+    file_format = file_format or _detect_format(filename)
+    if file_format == 'npy':
+        data = np.load(filename, mmap_mode='r')
+        if data.ndim == 2:
+            data = data[:, column]
+        for start in range(0, len(data), chunk_size):
+            yield np.asarray(data[start:start + chunk_size], dtype=np.float64)
+    elif file_format == 'raw':
+        with open(filename, 'rb') as f:
+            while True:
+                chunk = np.fromfile(f, dtype=dtype, count=chunk_size)
+                if not len(chunk):
+                    break
+                yield chunk.astype(np.float64, copy=False)
+    elif file_format == 'csv':
+        with open(filename, 'r') as f:
+            first_line = True
+            while True:
+                lines = f.readlines(chunk_size * 16)
+                if not lines:
+                    break
+                if first_line:
+                    first_line = False
+                    fields = lines[0].split(delimiter)
+                    if len(fields) > column and not _is_number(fields[column]):
+                        # a header line
+                        lines = lines[1:]
+                yield np.loadtxt(lines, delimiter=delimiter, usecols=column, ndmin=1, dtype=np.float64)
+    else:
+        raise ValueError('unknown file format: %s' % file_format)
+
+def count_values(filename, file_format=None, column=0, delimiter=',', dtype='<f8'):
+    """ the number of voltages read_voltage_chunks() yields, without keeping them """
+    import numpy as np
+    file_format = file_format or _detect_format(filename)
+    if file_format == 'npy':
+        return len(np.load(filename, mmap_mode='r'))
+    if file_format == 'raw':
+        return os.path.getsize(filename) // np.dtype(dtype).itemsize
+    return sum(len(chunk) for chunk in read_voltage_chunks(filename, file_format, column=column, delimiter=delimiter))
+
+def convert_file(filename, table_names=('tpr2', 'ikr'), output=None, file_format=None, chunk_size=1 << 20,
+                 column=0, delimiter=',', dtype='<f8'):
+    """
+    Convert the voltages in filename with each of the tables, chunk by
+    chunk. The result has a voltage column and one pressure column per
+    table and goes to output: a .npy file (structured array), any other
+    filename (CSV) or a file object (CSV). Returns the number of values.
+    """
+    import numpy as np
+    tables = [get_calibration_table(name) for name in table_names]
+    columns = ['voltage'] + list(table_names)
+    options = dict(file_format=file_format, column=column, delimiter=delimiter, dtype=dtype)
+    chunks = read_voltage_chunks(filename, chunk_size=chunk_size, **options)
+    count = 0
+    if isinstance(output, str) and output.endswith('.npy'):
+        # the header needs the length, the records are appended chunk by chunk
+        dtype = np.dtype([(name, np.float64) for name in columns])
+        header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                  'shape': (count_values(filename, **options),)}
+        with open(output, 'wb') as f:
+            np.lib.format.write_array_header_1_0(f, header)
+            for voltages in chunks:
+                rows = np.empty(len(voltages), dtype=dtype)
+                rows['voltage'] = voltages
+                for name, table in zip(table_names, tables):
+                    rows[name] = table.convert_many(voltages)
+                f.write(rows.tobytes())
+                count += len(voltages)
+        return count
+    f = open(output, 'w') if isinstance(output, str) else output
+    try:
+        f.write(','.join(columns) + '\n')
+        for voltages in chunks:
+            converted = np.empty((len(voltages), len(columns)))
+            converted[:, 0] = voltages
+            for i, table in enumerate(tables):
+                converted[:, i + 1] = table.convert_many(voltages)
+            np.savetxt(f, converted, delimiter=',', fmt='%.10g')
+            count += len(voltages)
+    finally:
+        if f is not output:
+            f.close()
+    return count
+
 def main():
-    from balzerspkg020 import tables
+    import argparse
     import sys
+    from balzerspkg020 import tables
+    parser = argparse.ArgumentParser(description='Convert Balzers PKG020 voltages to pressures. '
+        'Without files, convert the numbers typed on stdin one by one.')
+    parser.add_argument('voltage_file', nargs='*', help='CSV, .npy or raw float file of voltages to convert in bulk')
+    parser.add_argument('--tables', '-t', default='tpr2,ikr', help='comma separated tables to convert with, of: %s' % ', '.join(tables))
+    parser.add_argument('--output', '-o', help='.npy or CSV file to write (default: CSV to stdout), with one file per voltage file use {name} for its name')
+    parser.add_argument('--format', '-f', choices=('csv', 'npy', 'raw'), help='format of the voltage files (default: from the extension, raw if unknown)')
+    parser.add_argument('--column', '-c', type=int, default=0, help='column of the voltages in CSV and 2d .npy files')
+    parser.add_argument('--delimiter', '-d', default=',', help='delimiter of CSV files')
+    parser.add_argument('--dtype', default='<f8', help='data type of raw files, e.g. <f4')
+    parser.add_argument('--chunk-size', type=int, default=1 << 20, help='number of voltages converted at once')
+    args = parser.parse_args()
+    table_names = [name.strip() for name in args.tables.split(',')]
+    for name in table_names:
+        if name not in tables:
+            parser.error('unknown table: %s' % name)
+    if args.voltage_file:
+        if args.output and len(args.voltage_file) > 1 and '{name}' not in args.output:
+            parser.error('--output needs {name} when converting several files')
+        for filename in args.voltage_file:
+            name = os.path.splitext(os.path.basename(filename))[0]
+            output = args.output.format(name=name) if args.output else sys.stdout
+            count = convert_file(filename, table_names, output=output, file_format=args.format,
+                chunk_size=args.chunk_size, column=args.column, delimiter=args.delimiter, dtype=args.dtype)
+            if args.output:
+                print(f"{filename} -> {output}: {count} values", file=sys.stderr)
+        return
     while True:
         line = sys.stdin.readline()
         if not line: break
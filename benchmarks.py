@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+
+"""
+Performance measurements for the reference curve tools.
+
+Run `./benchmarks.py --help` to see the available benchmarks. Save the
+results with --output and compare two saved runs with
+`./benchmarks.py --compare baseline.json results.json`.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+def synthetic_pumpdown(n_points, interval=2.0, seed=0, chunk_size=100000):
+    """
+    Generate a deterministic pump-down in chunks of up to chunk_size
+    samples: (elapsed time, pressure with 2 % noise, gauge voltage).
+    """
+    import numpy as np
+    for first in range(0, n_points, chunk_size):
+        rng = np.random.default_rng((seed, first))
+        count = min(chunk_size, n_points - first)
+        elapsed = (first + np.arange(count)) * interval
+        # roughing pump phase followed by a slow outgassing limited decay
+        pressure = 1000. * np.exp(-elapsed / 60.) + 1e-3 / (1. + elapsed / 600.) + 1e-8
+        pressure *= np.exp(rng.normal(0., 0.02, count))
+        voltages = np.round(rng.uniform(0., 10., count), 6)
+        yield elapsed, pressure, voltages
+
+def write_synthetic_log(filename, n_points, start=1567000000.0, interval=2.0, seed=0, voltages=True):
+    """
+    Write a deterministic pump-down in the vacuum_pumping_curve v1.0.0
+    format as written by log_pumping_curve.py.
+    """
+    with open(filename, 'w') as f:
+        f.write('# vacuum_pumping_curve v1.0.0 \n')
+        f.write(json.dumps({'filetype': 'vacuum_pumping_curve', 'version': 'v1.0.0'}) + '\n')
+        f.write(json.dumps({'gauge_plugin': 'balzers', 'channel': ['AIN0', 'synthetic']}) + '\n')
+        f.write(json.dumps({'action': 'pumping_started', 'ts': start, 'comment': 'synthetic'}) + '\n')
+        for elapsed, pressure, voltage in synthetic_pumpdown(n_points, interval=interval, seed=seed):
+            ts = (start + elapsed).tolist()
+            pressure = pressure.tolist()
+            if voltages:
+                lines = [f'{{"voltages": [{v!r}], "ts": {t!r}, "pressure": {p!r}}}\n'
+                         for v, t, p in zip(voltage.tolist(), ts, pressure)]
+            else:
+                lines = [f'{{"ts": {t!r}, "pressure": {p!r}}}\n' for t, p in zip(ts, pressure)]
+            f.write(''.join(lines))
+
+def write_synthetic_v2(filename, n_points, start=1567000000.0, interval=2.0, seed=0):
+    """ The same pump-down as write_synthetic_log() in the v2.0.0 format """
+    import numpy as np
+    import pumping_curve_v2
+    header = pumping_curve_v2.make_header(gauge_plugin='balzers', channel=['AIN0', 'synthetic'],
+        pumping_started=start, comment='synthetic')
+    dtype = pumping_curve_v2.record_dtype(header['fields'])
+    with open(filename, 'wb') as f:
+        pumping_curve_v2.write_header(f, header)
+        for elapsed, pressure, _ in synthetic_pumpdown(n_points, interval=interval, seed=seed):
+            records = np.empty(len(elapsed), dtype=dtype)
+            records['ts'] = start + elapsed
+            records['pressure'] = pressure
+            f.write(records.tobytes())
+
+def parse_refcurve_json(filename):
+    """ The loader used before refcurves.parse_refcurve(), kept for comparison """
+    with open(filename, 'r') as f:
+        content = f.read()
+    chunks = [json.loads(line) for line in content.split('\n') if line.strip().startswith('{')]
+    pressure_readings = [chunk for chunk in chunks if 'pressure' in chunk]
+    timestamps = [pr['ts'] for pr in pressure_readings]
+    pressure = [pr['pressure'] for pr in pressure_readings]
+    starts = [chunk for chunk in chunks if 'action' in chunk and chunk['action'] == 'pumping_started']
+    first_start = starts[0]['ts'] if len(starts) else float('nan')
+    return timestamps, pressure, first_start
+
+def timeit(func, *args, repeat=3, setup=None, **kwargs):
+    """ Return the best wall clock time of repeat calls to func, setup() runs untimed before each """
+    best = float('inf')
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def bench_parse_refcurve(sizes=(10000, 100000, 1000000), repeat=3, quick=False):
+    from refcurves import parse_refcurve
+    if quick:
+        sizes = [size for size in sizes if size <= 100000]
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_points in sizes:
+            filename = os.path.join(tmpdir, 'synthetic_%d.log' % n_points)
+            write_synthetic_log(filename, n_points)
+            json_time = timeit(parse_refcurve_json, filename, repeat=repeat)
+            streaming_time = timeit(parse_refcurve, filename, repeat=repeat)
+            results.append({
+                'n_points': n_points,
+                'file_size_mb': os.path.getsize(filename) / 2**20,
+                'json_loader_s': json_time,
+                'streaming_parser_s': streaming_time,
+                'speedup': json_time / streaming_time,
+            })
+            print(f"parse_refcurve {n_points:>9d} points: json {json_time:.3f} s, streaming {streaming_time:.3f} s ({json_time / streaming_time:.1f}x)")
+    return results
+
+class Mvc3Emulator:
+    """
+    A Vacom MVC-3 answering RPV<n> commands on a pseudo terminal.
+
+    Replies take reply_delay seconds plus the transmission time at
+    19200 baud. Use .port as the identifier for VacomMvc3.
+    """
+
+    def __init__(self, reply_delay=0.002, baudrate=19200):
+        import pty
+        import threading
+        import tty
+        self.reply_delay = reply_delay
+        self.byte_time = 10. / baudrate
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        import select
+        pending = b''
+        while self._running:
+            readable, _, _ = select.select([self.master], [], [], 0.1)
+            if not readable:
+                continue
+            pending += os.read(self.master, 1024)
+            while b'\r' in pending:
+                command, _, pending = pending.partition(b'\r')
+                if not command.startswith(b'RPV'):
+                    continue
+                channel = int(command[3:])
+                reply = b'0, %.2E\r' % (10. ** -channel)
+                time.sleep(self.reply_delay + len(reply) * self.byte_time)
+                os.write(self.master, reply)
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+def get_reading_sleep_poll(ser, channel):
+    """ VacomMvc3.get_reading() before the terminator driven protocol """
+    read_command = b"RPV%d\r" % channel
+    ser.write(read_command)
+    time.sleep(.03)
+    pressure = ''
+    while ser.inWaiting() > 0:
+        pressure += ser.read(1).decode('ascii')
+    if pressure[0] == '0':
+        return float(pressure[3:-1])
+    else:
+        return float('nan')
+
+def bench_vacom_mvc3(channels=(1, 2, 3), rounds=20, repeat=3, quick=False):
+    from vacom_mvc3_plugin import VacomMvc3
+    if quick:
+        rounds = 5
+    emulator = Mvc3Emulator()
+    try:
+        gauge = VacomMvc3(identifier=emulator.port, channels=channels)
+        def sleep_poll():
+            for _ in range(rounds):
+                [get_reading_sleep_poll(gauge.ser, channel) for channel in channels]
+        def sequential():
+            gauge.pipelined = False
+            for _ in range(rounds):
+                gauge.get_readings()
+        def pipelined():
+            gauge.pipelined = True
+            for _ in range(rounds):
+                gauge.get_readings()
+        results = {'channels': len(channels)}
+        for name, func in (('sleep_poll', sleep_poll), ('sequential', sequential), ('pipelined', pipelined)):
+            results[name + '_s'] = timeit(func, repeat=repeat) / rounds
+            print(f"vacom_mvc3 {len(channels)} channels, {name:>10s}: {results[name + '_s'] * 1000:.1f} ms per reading")
+        gauge.ser.close()
+    finally:
+        emulator.close()
+    return results
+
+def synthetic_value_table(size):
+    """ A calibration table shaped like the TPR2 one: log-pressure roughly linear in voltage """
+    import numpy as np
+    voltages = np.linspace(0., 10., size)
+    pressures = np.logspace(-4., 3., size)
+    return [[float(v), float(p)] for v, p in zip(voltages, pressures)]
+
+def bench_interpolation(table_sizes=(10, 100, 1000), batch_sizes=(1, 100, 10000), repeat=3, quick=False):
+    import numpy as np
+    from balzerspkg020_helpers import interpolate_numpy, interpolate_naive, interpolate_log_aware, CalibrationTable
+    if quick:
+        batch_sizes = [size for size in batch_sizes if size <= 1000]
+    results = []
+    for table_size in table_sizes:
+        value_table = synthetic_value_table(table_size)
+        calibration_table = CalibrationTable(value_table)
+        for batch_size in batch_sizes:
+            values = np.random.default_rng(table_size).uniform(0., 10., batch_size)
+            scalars = values.tolist()
+            entry = {
+                'table_size': table_size,
+                'batch_size': batch_size,
+                'numpy_s': timeit(interpolate_numpy, values, value_table, repeat=repeat),
+                'naive_s': timeit(lambda: [interpolate_naive(v, value_table) for v in scalars], repeat=repeat),
+                'log_aware_s': timeit(lambda: [interpolate_log_aware(v, value_table) for v in scalars], repeat=repeat),
+                'calibration_table_s': timeit(lambda: [calibration_table.convert(v) for v in scalars], repeat=repeat),
+                'calibration_table_many_s': timeit(calibration_table.convert_many, values, repeat=repeat),
+            }
+            results.append(entry)
+            print(f"interpolation table {table_size:>5d} batch {batch_size:>6d}: " + ', '.join(
+                f"{key[:-2]} {entry[key] / batch_size * 1e6:.2f}" for key in entry if key.endswith('_s')) + ' us per value')
+    return results
+
+def bench_get_refcurve(sizes=(10000, 100000, 1000000, 10000000), repeat=3, quick=False):
+    """ parsing, loading from the sidecar cache and memory-mapping v2.0.0 files """
+    import shutil
+    from refcurves import get_refcurve, parse_refcurve
+    if quick:
+        sizes = [size for size in sizes if size <= 100000]
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_directory = os.path.join(tmpdir, 'cache')
+        def clear_cache():
+            shutil.rmtree(cache_directory, ignore_errors=True)
+        for n_points in sizes:
+            filename = os.path.join(tmpdir, 'synthetic_%d.log' % n_points)
+            v2_filename = os.path.join(tmpdir, 'synthetic_%d.v2.log' % n_points)
+            write_synthetic_log(filename, n_points)
+            write_synthetic_v2(v2_filename, n_points)
+            entry = {
+                'n_points': n_points,
+                'parse_s': timeit(parse_refcurve, filename, repeat=repeat),
+                'uncached_s': timeit(get_refcurve, filename, cache_directory=cache_directory, setup=clear_cache, repeat=repeat),
+                'cached_s': timeit(get_refcurve, filename, cache_directory=cache_directory, repeat=repeat),
+                'v2_s': timeit(get_refcurve, v2_filename, cache_directory=cache_directory, repeat=repeat),
+            }
+            results.append(entry)
+            os.remove(filename)
+            os.remove(v2_filename)
+            print(f"get_refcurve {n_points:>9d} points: " + ', '.join(
+                f"{key[:-2]} {entry[key]:.4f} s" for key in entry if key.endswith('_s')))
+    return results
+
+def write_synthetic_tree(root_directory, depth=4, branching=5, files_per_directory=4, n_points=200):
+    """ directories branching levels deep, each with files_per_directory short logs """
+    count = 0
+    directories = [root_directory]
+    for level in range(depth):
+        directories = [os.path.join(directory, 'chamber_%d' % i) for directory in directories for i in range(branching)]
+        for directory in directories:
+            os.makedirs(directory)
+            for i in range(files_per_directory):
+                write_synthetic_log(os.path.join(directory, 'run_%d.log' % i), n_points, seed=count, voltages=False)
+                count += 1
+    return count
+
+def bench_refcurves_metadata(depth=4, branching=5, files_per_directory=4, repeat=3, quick=False):
+    """ a full scan compared to building and reusing the SQLite index """
+    import refcurves
+    from refcurve_index import RefcurveIndex
+    if quick:
+        depth = 3
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root_directory = os.path.join(tmpdir, 'data')
+        db_filename = os.path.join(tmpdir, 'index.sqlite')
+        n_files = write_synthetic_tree(root_directory, depth=depth, branching=branching,
+                                       files_per_directory=files_per_directory)
+        def remove_index():
+            if os.path.exists(db_filename):
+                os.remove(db_filename)
+        def indexed():
+            index = RefcurveIndex(db_filename)
+            try:
+                index.update(root_directory)
+                return index.tree(root_directory)
+            finally:
+                index.close()
+        # no sidecar caches from other runs
+        cache_directory, refcurves.CACHE_DIRECTORY = refcurves.CACHE_DIRECTORY, os.path.join(tmpdir, 'cache')
+        try:
+            results = {
+                'depth': depth,
+                'n_files': n_files,
+                # renamed from scan_s when the full scan started reading the stored milestones
+                'scan_milestones_s': timeit(refcurves.get_refcurves_metadata, root_directory, use_index=False, repeat=repeat),
+                'index_build_s': timeit(indexed, setup=remove_index, repeat=repeat),
+                'index_update_s': timeit(indexed, repeat=repeat),
+            }
+        finally:
+            refcurves.CACHE_DIRECTORY = cache_directory
+    print(f"get_refcurves_metadata {n_files} files, depth {depth}: " + ', '.join(
+        f"{key[:-2]} {results[key]:.3f} s" for key in results if key.endswith('_s')))
+    return results
+
+def bench_show_data(sizes=(10000, 100000, 1000000, 10000000), repeat=3, quick=False):
+    """ VacuumPlot.show_data() and the first render, using the offscreen Qt platform """
+    import numpy as np
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    from gui_vacuum_plot import VacuumPlot
+    from refcurves import ReferenceCurve
+    if quick:
+        sizes = [size for size in sizes if size <= 100000]
+    app = QApplication.instance() or QApplication([])
+    vp = VacuumPlot()
+    vp.resize(1200, 800)
+    vp.show()
+    app.processEvents()
+    results = []
+    for n_points in sizes:
+        chunks = list(synthetic_pumpdown(n_points))
+        start = 1567000000.0
+        rc = ReferenceCurve(name='synthetic', filename='synthetic.log', start=start,
+            timestamps=start + np.concatenate([chunk[0] for chunk in chunks]),
+            pressure=np.concatenate([chunk[1] for chunk in chunks]))
+        def show_data():
+            vp.show_data('synthetic', rc)
+        def show_and_render():
+            vp.show_data('synthetic', rc)
+            app.processEvents()
+            vp.grab()
+        entry = {
+            'n_points': n_points,
+            'show_data_s': timeit(show_data, setup=lambda: vp.remove_all_but([]), repeat=repeat),
+            'render_s': timeit(show_and_render, setup=lambda: vp.remove_all_but([]), repeat=repeat),
+        }
+        results.append(entry)
+        print(f"show_data {n_points:>9d} points: show_data {entry['show_data_s']:.4f} s, with first render {entry['render_s']:.4f} s")
+    vp.close()
+    return results
+
+BENCHMARKS = {
+    'interpolation': bench_interpolation,
+    'parse_refcurve': bench_parse_refcurve,
+    'get_refcurve': bench_get_refcurve,
+    'refcurves_metadata': bench_refcurves_metadata,
+    'show_data': bench_show_data,
+    'vacom_mvc3': bench_vacom_mvc3,
+}
+
+def environment():
+    """ where the results come from: versions and the git commit """
+    import platform
+    import subprocess
+    import numpy as np
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+    }
+
+def timings(results):
+    """ flatten saved results to {'benchmark param=value ...: key': seconds} """
+    flat = {}
+    for name, result in results['results'].items():
+        for entry in (result if isinstance(result, list) else [result]):
+            params = ' '.join(f"{key}={value}" for key, value in entry.items()
+                              if isinstance(value, (int, str)) and not isinstance(value, bool))
+            for key, value in entry.items():
+                if key.endswith('_s'):
+                    flat[f"{name} {params}: {key[:-2]}"] = value
+    return flat
+
+def compare(baseline_filename, filename, threshold=0.1):
+    """ print the timings of two result files side by side, return the number of regressions """
+    with open(baseline_filename) as f:
+        baseline = json.load(f)
+    with open(filename) as f:
+        current = json.load(f)
+    print(f"baseline: {baseline_filename} ({baseline['environment'].get('commit')}, {baseline['environment']['date']})")
+    print(f"current:  {filename} ({current['environment'].get('commit')}, {current['environment']['date']})")
+    old, new = timings(baseline), timings(current)
+    regressions = 0
+    width = max((len(key) for key in new), default=0)
+    for key in new:
+        if key not in old:
+            print(f"{key:<{width}}  {'':>10}  {new[key]:10.4g}  (new)")
+            continue
+        ratio = new[key] / old[key] if old[key] > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'SLOWER'
+            regressions += 1
+        elif ratio < 1 / (1 + threshold):
+            flag = 'faster'
+        print(f"{key:<{width}}  {old[key]:10.4g}  {new[key]:10.4g}  {ratio:6.2f}x {flag}")
+    return regressions
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('benchmark', nargs='*', help='benchmarks to run, one of %s (default: all)' % ', '.join(BENCHMARKS))
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='take the best of this many runs')
+    parser.add_argument('--quick', '-q', action='store_true', help='skip the largest sizes')
+    parser.add_argument('--output', '-o', help='save the results to this JSON file')
+    parser.add_argument('--compare', '-c', nargs=2, metavar=('BASELINE', 'RESULTS'),
+        help='compare two saved result files instead of running benchmarks')
+    parser.add_argument('--threshold', '-t', type=float, default=10., help='percent slowdown reported as a regression by --compare')
+    args = parser.parse_args()
+    if args.compare:
+        regressions = compare(*args.compare, threshold=args.threshold / 100.)
+        raise SystemExit(1 if regressions else 0)
+    for name in args.benchmark:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: %s' % name)
+    results = {'environment': environment(), 'results': {}}
+    for name in args.benchmark or BENCHMARKS:
+        results['results'][name] = BENCHMARKS[name](repeat=args.repeat, quick=args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""
+Render plots of reference curves without a display.
+
+Every worker process of the pool runs its own offscreen QApplication
+with a single VacuumPlot that is reused for all curves it gets. Plots
+go to --output-dir as PNG or SVG, --thumbnails renders the small icons
+shown in the curve tree into the cache (see refcurves.get_thumbnail()).
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from refcurve_archive import is_refcurve_filename
+
+THUMBNAIL_SIZE = (96, 64)
+
+_app = None
+_vp = None
+
+def _init_worker():
+    global _app, _vp
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    from gui_vacuum_plot import VacuumPlot
+    _app = QApplication.instance() or QApplication([])
+    _vp = VacuumPlot()
+    _vp.show()
+
+def render_curve(filename, outputs, color=(31, 119, 180)):
+    """
+    Plot the curve filename once per (output, width, height, thumbnail)
+    in outputs. Thumbnails have no axes and get the mtime of the log.
+    """
+    from refcurves import get_refcurve
+    if _vp is None:
+        _init_worker()
+    stat = os.stat(filename)
+    rc = get_refcurve(filename)
+    for output, width, height, thumbnail in outputs:
+        _vp.remove_all_but([])
+        for axis in ('left', 'bottom'):
+            _vp.showAxis(axis, not thumbnail)
+        _vp.resize(width, height)
+        _vp.enableAutoRange()
+        _app.processEvents()
+        _vp.show_data(filename, rc, c=color)
+        _app.processEvents()
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        if thumbnail:
+            # write to a temporary file first so that the tree never shows a partial icon
+            tmp_output = output + '.tmp.png'
+            _vp.save_as(tmp_output, width=width)
+            os.utime(tmp_output, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.replace(tmp_output, output)
+        else:
+            _vp.save_as(output, width=width)
+    return [output for output, *_ in outputs]
+
+def find_curves(paths):
+    """ (filename, name relative to the given folder) for the logs in and below paths """
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if is_refcurve_filename(name):
+                        filename = os.path.join(dirpath, name)
+                        yield filename, os.path.relpath(filename, path)
+        else:
+            yield path, os.path.basename(path)
+
+def _strip_log_extension(name):
+    for extension in ('.gz', '.xz', '.zst', '.log'):
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    return name
+
+def main():
+    import argparse
+    from refcurves import get_thumbnail, thumbnail_filename
+    parser = argparse.ArgumentParser(description='Render plots and thumbnails of reference curves without a display')
+    parser.add_argument('path', nargs='+', help='log files or folders to search for them')
+    parser.add_argument('--output-dir', '-o', help='write a plot of each curve to this folder')
+    parser.add_argument('--format', '-f', choices=('png', 'svg'), default='png')
+    parser.add_argument('--width', '-W', type=int, default=1920)
+    parser.add_argument('--height', '-H', type=int, default=1080)
+    parser.add_argument('--thumbnails', '-t', action='store_true', help='render the thumbnails shown in the curve tree')
+    parser.add_argument('--force', action='store_true', help='also render thumbnails that are up to date')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help='number of worker processes')
+    args = parser.parse_args()
+    if not args.output_dir and not args.thumbnails:
+        parser.error('nothing to do, give --output-dir and/or --thumbnails')
+    if args.thumbnails and thumbnail_filename('') is None:
+        parser.error('thumbnails need the cache directory (REFCURVES_CACHE_DIR)')
+    tasks = []
+    for filename, name in find_curves(args.path):
+        outputs = []
+        if args.output_dir:
+            output = os.path.join(args.output_dir, _strip_log_extension(name) + '.' + args.format)
+            outputs.append((output, args.width, args.height, False))
+        if args.thumbnails and (args.force or get_thumbnail(filename) is None):
+            outputs.append((thumbnail_filename(filename),) + THUMBNAIL_SIZE + (True,))
+        if outputs:
+            tasks.append((filename, outputs))
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(tasks))), initializer=_init_worker) as pool:
+        futures = {pool.submit(render_curve, filename, outputs): filename for filename, outputs in tasks}
+        for future in as_completed(futures):
+            try:
+                outputs = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"{futures[future]}: failed: {e}", file=sys.stderr)
+            else:
+                print(f"{futures[future]} -> {', '.join(outputs)}")
+    print(f"{len(tasks) - failed} curves rendered, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 class GaugeError(Exception):
     pass
@@ -10,3 +12,25 @@ class Gauge:
     def get_reading(self):
         """ returns pressure in mbar """
         raise NotImplementedError()
+
+    def get_readings(self):
+        """ returns {'pressures': [...]} in mbar for all selected channels """
+        raise NotImplementedError()
+
+    async def get_readings_async(self):
+        """
+        Awaitable version of get_readings().
+
+        The blocking call runs in an executor owned by this gauge, so that
+        a slow gauge never delays the others and a single device is never
+        accessed from two threads at once.
+        """
+        return await self.call_async(self.get_readings)
+
+    async def call_async(self, method, *args):
+        """ await a blocking method of this gauge, see get_readings_async() """
+        executor = getattr(self, '_executor', None)
+        if executor is None:
+            executor = self._executor = ThreadPoolExecutor(max_workers=1)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, method, *args)
@@ -13,17 +13,24 @@ from PyQt5.Qt import Qt
 
 from gui_list_reference_curves import CheckboxTree
 from gui_vacuum_plot import VacuumPlot
-from refcurves import get_refcurves_metadata, get_refcurve
+from refcurves import get_refcurves_metadata, refcurve_cache, RefcurveFollower
 
 import sys, time, copy
+from concurrent.futures import ThreadPoolExecutor
 
 class ReferenceCurveGUI(QWidget):
 
     last_checked_filenames = None
+    # emitted from the loader threads, delivered in the GUI thread
+    curve_loaded_signal = QtCore.pyqtSignal(str, object)
 
-    def __init__(self):
+    def __init__(self, max_workers=4):
         super().__init__()
 
+        self.loader_pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending_loads = {}
+        self.curve_loaded_signal.connect(self.curve_loaded)
+
         self.initUI()
 
     def keyPressEvent(self, e):
@@ -83,27 +90,87 @@ class ReferenceCurveGUI(QWidget):
             return
         self.last_checked_filenames = copy.copy(self.ct.checked_filenames)
 
+        # cancel loads of curves that were unchecked before they finished
+        for filename in list(self.pending_loads):
+            if filename not in self.ct.checked_filenames:
+                self.pending_loads.pop(filename).cancel()
+                self.ct.set_loading(filename, False)
         for filename in self.ct.checked_filenames:
-            rc = get_refcurve(filename)
-            color = self.ct.color_for_filename(filename)
-            self.vp.show_data(filename, rc=rc, c=color)
+            if filename in self.vp.current_plots or filename in self.pending_loads:
+                continue
+            self.ct.set_loading(filename, True)
+            self.pending_loads[filename] = self.loader_pool.submit(self.load_curve, filename)
         self.vp.remove_all_but(self.ct.checked_filenames)
         #self.vp.setXRange(0., 10.)
         #self.vp.draw_start()
         #self.vp.save_as('exported_chart.png', width=1920)
 
-    def live_plot(self, source):
-        return
-        ### Start a timer to rapidly update the plot in pw
-        #t = QtCore.QTimer()
-        #t.timeout.connect(updateData)
-        #t.start(50)
-        #updateData()
+    def load_curve(self, filename):
+        """ runs in a loader thread """
+        try:
+            rc = refcurve_cache.get(filename)
+        except Exception as e:
+            print("Could not load %s: %s" % (filename, e), file=sys.stderr)
+            rc = None
+        self.curve_loaded_signal.emit(filename, rc)
+
+    @QtCore.pyqtSlot(str, object)
+    def curve_loaded(self, filename, rc):
+        future = self.pending_loads.pop(filename, None)
+        if future is None:
+            # load got cancelled meanwhile
+            return
+        self.ct.set_loading(filename, False)
+        if rc is None or filename not in self.ct.checked_filenames:
+            return
+        color = self.ct.color_for_filename(filename)
+        self.vp.show_data(filename, rc=rc, c=color)
+
+    def closeEvent(self, event):
+        self.loader_pool.shutdown(wait=False, cancel_futures=True)
+        super().closeEvent(event)
+
+    def live_plot(self, source, poll_interval=2000):
+        """ overlay the log file source that is still being written """
+        self.live_follower = RefcurveFollower(source)
+        self.live_restarts = None
+        # get notified on changes where possible, poll as a fallback (e.g. network mounts)
+        self.live_watcher = QtCore.QFileSystemWatcher([source])
+        self.live_watcher.fileChanged.connect(self.update_live_plot)
+        self.live_timer = QtCore.QTimer()
+        self.live_timer.timeout.connect(self.update_live_plot)
+        self.live_timer.start(poll_interval)
+        self.update_live_plot()
+
+    def update_live_plot(self, *args):
+        follower = self.live_follower
+        if not follower.has_new_data():
+            return
+        if follower.filename not in self.live_watcher.files():
+            # the watch is lost when the file gets replaced
+            self.live_watcher.addPath(follower.filename)
+        timestamps, pressure = follower.read_new()
+        if follower.restarts != self.live_restarts:
+            self.live_restarts = follower.restarts
+            self.vp.remove_live('live')
+        if not len(timestamps):
+            return
+        if follower.start != follower.start:
+            # no pumping_started action in the log, count from the first record
+            follower.start = timestamps[0]
+        self.vp.append_data('live', timestamps - follower.start, pressure)
 
 if __name__ == '__main__':
 
-    app = QApplication(sys.argv)
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--live', metavar='LOGFILE', help='overlay a pump-down log that is still being written')
+    args, qt_args = parser.parse_known_args()
+
+    app = QApplication(sys.argv[:1] + qt_args)
     ex = ReferenceCurveGUI()
+    if args.live:
+        ex.live_plot(args.live)
 
     # keep Python in the loop in order to be able to press Ctrl-c
     timer = QtCore.QTimer()
@@ -5,10 +5,16 @@ from PyQt5 import QtCore
 from PyQt5 import QtGui
 from PyQt5.Qt import Qt
 import sys, copy
+from datetime import timedelta
 
 import matplotlib as mpl
 
-from refcurves import get_refcurves_metadata
+from refcurves import get_refcurves_metadata, MILESTONE_PRESSURES
+
+# item data role holding the original text while a curve is being loaded
+LOADING_NAME_ROLE = Qt.UserRole + 1
+# first column with the time to reach a milestone pressure
+MILESTONE_COLUMN = 2
 
 color_index = 0
 def next_color():
@@ -33,6 +39,38 @@ def get_monospace_font():
     if is_fixed_pitch(font): return font
     return font
 
+def metadata_tooltip(meta):
+    """ multi-line description of a curve from refcurves.get_refcurve_metadata() """
+    def pressure(value):
+        return 'n/a' if value is None else '%.2e mbar' % value
+    lines = [meta['filename']]
+    if meta.get('comment'):
+        lines.append(meta['comment'])
+    if meta.get('gauge_plugin'):
+        channel = meta.get('channel') or ['', '']
+        lines.append('gauge: %s, channel: %s' % (meta['gauge_plugin'], ' '.join(channel).strip()))
+    if 'point_count' in meta:
+        duration = meta['duration']
+        if duration == duration:
+            lines.append('duration: %s' % timedelta(seconds=round(duration)))
+        approx = '~' if meta.get('point_count_estimated') else ''
+        lines.append('points: %s%d' % (approx, meta['point_count']))
+        lines.append('first: %s, last: %s, min: %s' % (pressure(meta['first_pressure']),
+            pressure(meta['last_pressure']), pressure(meta['min_pressure'])))
+    return '\n'.join(lines)
+
+class CurveItem(QtWidgets.QTreeWidgetItem):
+    """ sorts the milestone columns by time, curves that didn't reach a milestone last """
+
+    def __lt__(self, other):
+        column = self.treeWidget().sortColumn()
+        if column < MILESTONE_COLUMN:
+            return super().__lt__(other)
+        def key(item):
+            seconds = item.data(column, Qt.UserRole)
+            return (seconds is None, seconds or 0., item.text(0))
+        return key(self) < key(other)
+
 class CheckboxTree(QtWidgets.QTreeWidget):
     """ https://stackoverflow.com/a/57820072/183995 """
 
@@ -41,31 +79,39 @@ class CheckboxTree(QtWidgets.QTreeWidget):
     checked_filenames_changed_signal = QtCore.pyqtSignal()
     checked_filenames = set()
 
-    def __init__(self, data):
+    def __init__(self, data, milestone_pressures=MILESTONE_PRESSURES):
         super().__init__()
-        self.setColumnCount(2)
-        self.setHeaderLabels(['curve', 'color'])
+        self.milestone_pressures = list(milestone_pressures)
+        self.setColumnCount(MILESTONE_COLUMN + len(self.milestone_pressures))
+        self.setHeaderLabels(['curve', 'color'] + ['t(%.0e mbar)' % level for level in self.milestone_pressures])
         self.setColumnWidth(0, 600)
         self.setStyleSheet("QTreeWidget { font-size: 18; }")
         self.setIconSize(QtCore.QSize(32, 32))
         self.itemClicked.connect(self.click_handler)
 
         def add_subtree(element, parent=self, top_level=False):
-            current = QtWidgets.QTreeWidgetItem(parent)
+            current = CurveItem(parent)
             if top_level: current.setExpanded(True)
             text = element['name']
-            #if 'date' in element:
-            #    text = element['date'] + ' - ' + text
+            if element.get('date'):
+                text = element['date'] + ' - ' + text
             current.setText(0, text)
             if 'icon' in element:
                 current.setIcon(0, QtGui.QIcon(element['icon']))
                 #current.setData(0, Qt.DecorationRole, QtGui.QPixmap(element['icon']));
+            elif 'thumbnail' in element:
+                current.setIcon(0, QtGui.QIcon(element['thumbnail']))
             if 'filename' in element:
                 current.setData(0, Qt.UserRole, element['filename'])
                 current.setText(1, next_color())
                 current.setFont(1, get_monospace_font())
-            if 'comment' in element:
-                current.setToolTip(0, element['comment'])
+                current.setToolTip(0, metadata_tooltip(element))
+                milestones = element.get('milestones', {})
+                for column, level in enumerate(self.milestone_pressures, MILESTONE_COLUMN):
+                    seconds = milestones.get(level)
+                    if seconds is not None:
+                        current.setText(column, str(timedelta(seconds=round(seconds))))
+                        current.setData(column, Qt.UserRole, seconds)
             current.setFlags(current.flags() & ~Qt.ItemIsSelectable)
             current.setFlags(current.flags() | Qt.ItemIsUserCheckable)
             current.setCheckState(0, Qt.Unchecked)
@@ -77,6 +123,10 @@ class CheckboxTree(QtWidgets.QTreeWidget):
         for element in data:
             add_subtree(element, top_level=True)
 
+        # keep the order of data until a column header is clicked
+        self.header().setSortIndicator(-1, Qt.AscendingOrder)
+        self.setSortingEnabled(True)
+
         #self.itemChanged['QTreeWidgetItem*'].connect(self.change_handler)
         self.itemChanged.connect(self.change_handler)
 
@@ -127,18 +177,39 @@ class CheckboxTree(QtWidgets.QTreeWidget):
             item.setText(column, color.name())
             self.update_styles()
 
-    def color_for_filename(self, filename):
+    def item_for_filename(self, filename):
         it = QtWidgets.QTreeWidgetItemIterator(self)
         while it.value():
             item = it.value()
             item_filename = item.data(0, Qt.UserRole)
             if item_filename == filename:
-                color = item.text(1)
-                color = QtGui.QColor(color)
-                return color
+                return item
             it += 1
         raise ValueError("filename %s not found in this CheckboxTree" % filename)
 
+    def color_for_filename(self, filename):
+        item = self.item_for_filename(filename)
+        color = item.text(1)
+        color = QtGui.QColor(color)
+        return color
+
+    def set_loading(self, filename, loading=True):
+        """ mark the curve of filename as being loaded in the background """
+        item = self.item_for_filename(filename)
+        name = item.data(0, LOADING_NAME_ROLE)
+        if loading and name is None:
+            item.setData(0, LOADING_NAME_ROLE, item.text(0))
+            item.setText(0, item.text(0) + ' (loading...)')
+            font = item.font(0)
+            font.setItalic(True)
+            item.setFont(0, font)
+        elif not loading and name is not None:
+            item.setData(0, LOADING_NAME_ROLE, None)
+            item.setText(0, name)
+            font = item.font(0)
+            font.setItalic(False)
+            item.setFont(0, font)
+
     def update_styles(self, item=None, column=None):
 
         def update_item(item):
@@ -171,13 +242,19 @@ class CheckboxTree(QtWidgets.QTreeWidget):
                 set_background("#eeeeee")
                 set_foreground('#333333')
 
-        if item:
-            update_item(item)
-        else:
-            it = QtWidgets.QTreeWidgetItemIterator(self)
-            while it.value():
-                update_item(it.value())
-                it += 1
+        # restyling emits itemChanged for every item, which would call this again
+        blocked = self.blockSignals(True)
+        try:
+            if item:
+                update_item(item)
+            else:
+                it = QtWidgets.QTreeWidgetItemIterator(self)
+                while it.value():
+                    update_item(it.value())
+                    it += 1
+        finally:
+            self.blockSignals(blocked)
+
 def main():
     app = QtWidgets.QApplication(sys.argv)
     tree = CheckboxTree(get_refcurves_metadata())
@@ -90,6 +90,121 @@ class TimeAxisItem(pg.AxisItem):
         else:
             return [ (3650*24*3600, 0), (365*24*3600, 0) ]
 
+class DecimationPyramid:
+    """
+    Precomputed min/max decimation levels of a curve.
+
+    Level 0 is the raw data, every further level keeps the minimum and
+    the maximum pressure of each bucket of `factor` points of the level
+    below, so that pressure spikes survive any amount of decimation.
+    As the logarithm is monotonic, min/max in log-pressure space pick
+    the very same points as in linear space, so the values are kept
+    as they are for pyqtgraph's log mode to transform. Samples that
+    aren't finite and positive are left out.
+    """
+
+    def __init__(self, x, y, factor=8, min_points=2000):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y)
+        # a NaN (logged e.g. for a gauge error) would be picked as min and max of its
+        # bucket, and values <= 0 can't be shown on the log axis anyway
+        usable = np.isfinite(x) & np.isfinite(y) & (y > 0)
+        if not usable.all():
+            x, y = x[usable], y[usable]
+        self.levels = [(x, y)]
+        while len(x) > min_points:
+            x, y = self._decimate(x, y, factor)
+            self.levels.append((x, y))
+
+    @staticmethod
+    def _decimate(x, y, factor):
+        n_buckets = len(x) // factor
+        n = n_buckets * factor
+        buckets = y[:n].reshape(n_buckets, factor)
+        offsets = np.arange(0, n, factor)
+        i_min = offsets + np.argmin(buckets, axis=1)
+        i_max = offsets + np.argmax(buckets, axis=1)
+        # keep both points of a bucket in their original order
+        indices = np.empty(2 * n_buckets, dtype=np.intp)
+        indices[0::2] = np.minimum(i_min, i_max)
+        indices[1::2] = np.maximum(i_min, i_max)
+        indices = np.concatenate((indices, np.arange(n, len(x))))
+        return x[indices], y[indices]
+
+    def select(self, x_min=None, x_max=None, max_points=4000):
+        """ the finest decimation of the range [x_min, x_max] with at most max_points points """
+        for x, y in self.levels:
+            i0 = 0 if x_min is None else max(np.searchsorted(x, x_min) - 1, 0)
+            i1 = len(x) if x_max is None else np.searchsorted(x, x_max) + 1
+            if i1 - i0 <= max_points:
+                break
+        return x[i0:i1], y[i0:i1]
+
+class LiveCurve:
+    """
+    A curve that grows at its end, shown as a chain of plot items.
+
+    Only the last segment is redrawn when points are appended,
+    full segments are sealed and never touched again. That way the
+    cost of an update depends on the number of new points and not on
+    the length of the curve.
+    """
+
+    def __init__(self, plot_widget, segment_size=5000, pen=None):
+        self.plot_widget = plot_widget
+        self.segment_size = segment_size
+        self.pen = pen
+        self.segments = []
+        self._x = np.empty(segment_size)
+        self._y = np.empty(segment_size)
+        self._size = 0
+        self._new_segment()
+
+    def _new_segment(self):
+        item = self.plot_widget.plot()
+        if self.pen is not None:
+            item.setPen(self.pen)
+        self.segments.append(item)
+
+    def append(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        while len(x):
+            n = min(len(x), self.segment_size - self._size)
+            self._x[self._size:self._size + n] = x[:n]
+            self._y[self._size:self._size + n] = y[:n]
+            self._size += n
+            x, y = x[n:], y[n:]
+            self.segments[-1].setData(x=self._x[:self._size], y=self._y[:self._size])
+            if self._size == self.segment_size:
+                self._seal()
+
+    def _seal(self):
+        # the sealed item keeps its own copy, the buffer gets reused
+        last_x, last_y = self._x[-1], self._y[-1]
+        self.segments[-1].setData(x=self._x.copy(), y=self._y.copy())
+        self._new_segment()
+        # start the next segment with the last point so the line is continuous
+        self._x[0], self._y[0] = last_x, last_y
+        self._size = 1
+
+    def set_pen(self, pen):
+        self.pen = pen
+        for item in self.segments:
+            item.setPen(pen)
+
+    def clear(self):
+        for item in self.segments:
+            self.plot_widget.removeItem(item)
+        self.segments = []
+        self._size = 0
+        self._new_segment()
+
+    def remove(self):
+        for item in self.segments:
+            self.plot_widget.removeItem(item)
+        self.segments = []
+
 class VacuumPlot(pg.PlotWidget):
     """
     influenced by
@@ -97,6 +212,8 @@ class VacuumPlot(pg.PlotWidget):
     """
 
     current_plots = {}
+    # points per pixel column when decimating curves for the current view
+    points_per_pixel = 2
     _crosshair_enabled = False
     _mouse_over_plot = False
 
@@ -110,6 +227,10 @@ class VacuumPlot(pg.PlotWidget):
 
         super().__init__(*args, **kwargs)
 
+        self.current_plots = {}
+        self.pyramids = {}
+        self.live_curves = {}
+
         self.setLogMode(y=True)
         self.getAxis('left').enableAutoSIPrefix(enable=False)
         self.showGrid(x=True, y=True, alpha=0.4)
@@ -137,6 +258,7 @@ class VacuumPlot(pg.PlotWidget):
 
         # fix to repaint formerly protruding axis tick labels
         self.sigRangeChanged.connect(self.forceRepaint)
+        self.sigRangeChanged.connect(self.update_decimation)
 
     def enableCrosshair(self):
         self._crosshair_enabled = True
@@ -195,12 +317,35 @@ class VacuumPlot(pg.PlotWidget):
     def show_data(self, id, rc=None, c=(200, 200, 100)):
         #if id in self.current_plots: plot = self.current_plots[id]
         #else: plot = self.plot()
-        plot = self.current_plots.get(id, self.plot())
+        plot = self.current_plots[id] if id in self.current_plots else self.plot()
         self.current_plots[id] = plot
         plot.setPen(width=3, color=c)
-        xd = [(ts-rc.start) for ts in rc.data[0]]
-        yd = rc.data[1]
-        plot.setData(y=yd, x=xd)
+        self.pyramids[id] = DecimationPyramid(rc.elapsed, rc.pressure)
+        self.update_decimation(ids=[id])
+
+    def update_decimation(self, *args, ids=None):
+        """ (re-)set the data of the plots for the currently visible x range """
+        vb = self.getViewBox()
+        max_points = max(int(vb.width() * self.points_per_pixel), 100)
+        if vb.autoRangeEnabled()[0]:
+            # the whole curves need to be known to auto-range
+            x_min = x_max = None
+        else:
+            x_min, x_max = vb.viewRange()[0]
+        for id in (self.pyramids if ids is None else ids):
+            x, y = self.pyramids[id].select(x_min, x_max, max_points=max_points)
+            self.current_plots[id].setData(x=x, y=y)
+
+    def append_data(self, id, x, y, c=(200, 0, 0)):
+        """ append points to the live curve id, creating it if necessary """
+        if id not in self.live_curves:
+            self.live_curves[id] = LiveCurve(self, pen=pg.mkPen(width=3, color=c))
+        self.live_curves[id].append(x, y)
+
+    def remove_live(self, id):
+        live_curve = self.live_curves.pop(id, None)
+        if live_curve:
+            live_curve.remove()
 
     def set_color(self, id, c=(200, 200, 100)):
         plot = self.current_plots.get(id, None)
@@ -227,11 +372,15 @@ class VacuumPlot(pg.PlotWidget):
                 ready_for_deletion.append(id)
         for id in ready_for_deletion:
             del self.current_plots[id]
+            self.pyramids.pop(id, None)
 
     def save_as(self, filename, width=200):
-        """ http://www.pyqtgraph.org/documentation/exporting.html """
-        exporter = pg.exporters.ImageExporter(self.plotItem)
-        exporter.parameters()['width'] = width # this also affects the height parameter
+        """ http://www.pyqtgraph.org/documentation/exporting.html, .svg files are vector graphics """
+        if filename.lower().endswith('.svg'):
+            exporter = pg.exporters.SVGExporter(self.plotItem)
+        else:
+            exporter = pg.exporters.ImageExporter(self.plotItem)
+            exporter.parameters()['width'] = width # this also affects the height parameter
         exporter.export(filename)
 
 def main():
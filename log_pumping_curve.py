@@ -1,11 +1,450 @@
 #!/usr/bin/env python
 
-import time, json, copy
+import time, json, os, asyncio, struct, math, re
 from datetime import datetime as dt
 
 from gauge_plugin import GaugeError
-import balzers_pkg020_plugin
-import vacom_mvc3_plugin, balzers_pkg020_plugin
+from acquisition_metrics import AcquisitionMetrics, write_prometheus
+import pumping_curve_v2
+from swinging_door import SwingingDoor, deviation_from_percent
+
+GAUGE_PLUGINS = ('vacom', 'balzers', 'simulated')
+# plugins with start_stream()/read_stream()/stop_stream(), see GaugeLogger.capture_stream()
+STREAMING_PLUGINS = ('balzers',)
+
+def open_gauge(plugin, identifier='', channels=()):
+    # the plugins are imported on demand, so that only the driver
+    # libraries of the gauges actually in use need to be installed
+    if plugin == 'balzers':
+        import balzers_pkg020_plugin
+        return balzers_pkg020_plugin.BalzersPkg020(identifier=identifier, channels=channels)
+    elif plugin == 'vacom':
+        import vacom_mvc3_plugin
+        return vacom_mvc3_plugin.VacomMvc3(identifier=identifier or '/dev/ttyUSB0', channels=channels)
+    elif plugin == 'simulated':
+        import simulated_gauge_plugin
+        return simulated_gauge_plugin.SimulatedGauge(identifier=identifier, channels=channels)
+    raise ValueError('unknown gauge plugin: %s' % plugin)
+
+class BufferedWriter:
+    """
+    Keeps a log file open and collects what is written in memory.
+
+    The collected data is written and fsync()ed once flush_records
+    records are pending or flush_interval seconds have passed since
+    the last flush, so at most that much data is lost on a power
+    failure. The time spent flushing goes to metrics (an
+    AcquisitionMetrics). Subclasses encode the records of a file format.
+    """
+
+    joiner = ''
+
+    def __init__(self, filename, flush_records=20, flush_interval=10., fsync=True, metrics=None, mode='a'):
+        self.filename = filename
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.metrics = metrics
+        self.file = open(filename, mode)
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def encode_record(self, record):
+        """ the items to add to pending for record """
+        raise NotImplementedError()
+
+    def write_record(self, record):
+        self.pending.extend(self.encode_record(record))
+        self.maybe_flush()
+
+    def write_records(self, records):
+        """ write_record() for a batch like a stream block, applying the flush policy once """
+        for record in records:
+            self.pending.extend(self.encode_record(record))
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        """ flush if the policy says so, call regularly even without new records """
+        if not self.pending:
+            return
+        if len(self.pending) >= self.flush_records or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            t0 = time.perf_counter()
+            self.file.write(self.joiner.join(self.pending))
+            self.pending = []
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            if self.metrics:
+                self.metrics.observe('write', time.perf_counter() - t0)
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+class LogWriter(BufferedWriter):
+    """
+    BufferedWriter for the JSON lines of the vacuum_pumping_curve v1.0.0
+    format. Action lines (like pumping_started) are synced at once.
+    """
+
+    def write_header(self, plugin, channel, pumping_started, comment=''):
+        self.write_line('# vacuum_pumping_curve v1.0.0 ')
+        self.write_record({'filetype': 'vacuum_pumping_curve', 'version': 'v1.0.0'})
+        self.write_record({'gauge_plugin': plugin, 'channel': channel})
+        self.write_action({'action': 'pumping_started', 'ts': pumping_started, 'comment': comment})
+
+    def write_line(self, line):
+        self.pending.append(line + '\n')
+        self.maybe_flush()
+
+    def encode_record(self, record):
+        return [json.dumps(record) + '\n']
+
+    def write_action(self, action):
+        self.pending.append(json.dumps(action) + '\n')
+        self.flush()
+
+class BinaryLogWriter(BufferedWriter):
+    """
+    BufferedWriter for the vacuum_pumping_curve v2.0.0 format (see pumping_curve_v2.py).
+
+    New files get their header with the first record, once it is
+    known whether the gauge delivers voltages, too. Existing files
+    are appended to, a new header is not written then. A record (or
+    header) torn by a power failure is cut off first, so that the
+    records appended after it stay aligned.
+    """
+
+    joiner = b''
+
+    def __init__(self, filename, channel_index=0, **kwargs):
+        self.channel_index = channel_index
+        self.header = None
+        self.struct = None
+        if os.path.exists(filename) and os.path.getsize(filename):
+            self._open_existing(filename)
+        super().__init__(filename, mode='ab', **kwargs)
+
+    def _open_existing(self, filename):
+        with open(filename, 'r+b') as f:
+            size = os.fstat(f.fileno()).st_size
+            try:
+                header, offset = pumping_curve_v2.read_header(f)
+            except ValueError:
+                f.seek(0)
+                start = f.read(1 << 16)
+                magic = pumping_curve_v2.MAGIC
+                if start[:len(magic)] != magic[:len(start)] or b'\n' + pumping_curve_v2.DATA_MARKER in start:
+                    # not a v2 file, or a broken header that isn't just cut off
+                    raise
+                # the header is written together with the first record, so there are no records yet
+                f.truncate(0)
+                return
+            self.header = header
+            self._set_fields(header['fields'])
+            complete_size = offset + (size - offset) // self.struct.size * self.struct.size
+            if complete_size != size:
+                f.truncate(complete_size)
+
+    def _set_fields(self, fields):
+        self.fields = fields
+        self.struct = struct.Struct('<' + 'd' * len(fields))
+
+    def write_header(self, plugin, channel, pumping_started, comment=''):
+        if self.struct is not None:
+            # appending to an existing file
+            return
+        self.header = pumping_curve_v2.make_header(gauge_plugin=plugin, channel=channel,
+            pumping_started=pumping_started, comment=comment)
+
+    def encode_record(self, record):
+        items = []
+        if self.struct is None:
+            fields = ['ts', 'pressure'] + (['voltage'] if 'voltages' in record else [])
+            self.header = self.header or pumping_curve_v2.make_header()
+            self.header['fields'] = fields
+            self._set_fields(fields)
+            items.append(pumping_curve_v2.MAGIC + json.dumps(self.header).encode('utf-8') + b'\n'
+                + pumping_curve_v2.DATA_MARKER)
+        values = [record['ts'], record['pressure']]
+        if 'voltage' in self.fields:
+            voltages = record.get('voltages')
+            values.append(voltages[self.channel_index] if voltages else float('nan'))
+        items.append(self.struct.pack(*values))
+        return items
+
+    def write_action(self, action):
+        # actions other than the pumping_started in the header aren't part of v2.0.0
+        self.flush()
+
+class SamplingScheduler:
+    """
+    Ticks on the fixed grid origin + n * interval of time.monotonic(),
+    so the time spent reading and writing doesn't add up and changes
+    of the wall clock don't matter. Loggers sharing the origin stay in
+    phase.
+
+    When a tick is missed because a cycle took too long, overrun='skip'
+    waits for the next tick on the grid, overrun='catch-up' runs the
+    missed ticks right away, one after the other.
+    """
+
+    OVERRUN_POLICIES = ('skip', 'catch-up')
+
+    def __init__(self, interval, origin=None, overrun='skip'):
+        if overrun not in self.OVERRUN_POLICIES:
+            raise ValueError('unknown overrun policy: %s' % overrun)
+        self.interval = interval
+        self.origin = time.monotonic() if origin is None else origin
+        self.overrun = overrun
+        self.tick = 0
+        self.skipped_ticks = 0
+
+    def deadline(self):
+        return self.origin + self.tick * self.interval
+
+    async def wait(self):
+        """ sleep until the next tick, return how late it was woken up (the jitter) """
+        now = time.monotonic()
+        if self.overrun == 'skip' and now > self.deadline() + self.interval:
+            # drop the ticks that passed meanwhile
+            tick = math.ceil((now - self.origin) / self.interval)
+            self.skipped_ticks += tick - self.tick
+            self.tick = tick
+        deadline = self.deadline()
+        if deadline > now:
+            await asyncio.sleep(deadline - now)
+        self.tick += 1
+        return time.monotonic() - deadline
+
+    def resume(self):
+        """ continue with the next tick on the grid after a pause, the ticks passed meanwhile aren't skipped ones """
+        self.tick = math.ceil((time.monotonic() - self.origin) / self.interval)
+
+class GaugeLogger:
+    """
+    Samples a single gauge on its own schedule and logs
+    each of its channels to a file of its own.
+    """
+
+    def __init__(self, gauge, plugin, channels, filenames, sampling_interval=2,
+                 logging_threshold=5., max_logging_interval=120, start=None, writer_options=None,
+                 file_format='v1', swinging_door_error=None, identifier='', origin=None, overrun='skip',
+                 stream=None):
+        self.gauge = gauge
+        self.plugin = plugin
+        self.channels = channels
+        self.filenames = filenames
+        self.sampling_interval = sampling_interval
+        self.logging_threshold = logging_threshold
+        self.max_logging_interval = max_logging_interval
+        self.start = start or time.time()
+        self.last_logging_time = 0.0
+        self.last_sample = None
+        self.last_sample_stored = False
+        # (scan rate, seconds) to capture the start with the gauge's hardware stream
+        self.stream = stream
+        # optional swinging door compression instead of the threshold rule
+        self.doors = None
+        if swinging_door_error:
+            deviation = deviation_from_percent(swinging_door_error)
+            self.doors = [SwingingDoor(deviation) for _ in channels]
+            self.last_stored = [0.0] * len(channels)
+        self.scheduler = SamplingScheduler(sampling_interval, origin=origin, overrun=overrun)
+        self.metrics = AcquisitionMetrics(plugin, identifier, sampling_interval)
+        writer_options = dict(writer_options or {}, metrics=self.metrics)
+        if file_format == 'v2':
+            self.writers = [BinaryLogWriter(filename, channel_index=i, **writer_options)
+                            for i, filename in enumerate(filenames)]
+        else:
+            self.writers = [LogWriter(filename, **writer_options) for filename in filenames]
+
+    def write_header(self):
+        for writer, chan in zip(self.writers, self.channels):
+            writer.write_header(self.plugin, chan, time.time())
+
+    def close(self):
+        if self.doors:
+            for i, door in enumerate(self.doors):
+                for sample in door.flush():
+                    self.writers[i].write_record(self.channel_record(sample, i))
+        for writer in self.writers:
+            writer.close()
+
+    @staticmethod
+    def channel_record(sample, i):
+        """ the record of channel i: the sample with its pressure instead of all pressures """
+        record = {key: value for key, value in sample.items() if key != 'pressures'}
+        record['pressure'] = sample['pressures'][i]
+        return record
+
+    def process(self, readings):
+        """ decide whether to store the new readings and write them """
+        pressures = readings['pressures']
+        print(f"{dt.now().isoformat(' ')} {time.time() - self.start:.1f} {self.plugin} pressure values: {pressures} [mbar]")
+        if self.doors:
+            return self.process_swinging_door(readings)
+        last_sample = self.last_sample
+        change_over_threshold = False
+        if last_sample:
+            for i in range(len(pressures)):
+                if abs((pressures[i] - last_sample['pressures'][i]) / last_sample['pressures'][i]) * 100 > self.logging_threshold:
+                    change_over_threshold = True
+        last_logging_far_ago = time.time() - self.last_logging_time > self.max_logging_interval
+        sample = readings
+        sample.update({'ts': time.time()})
+        if change_over_threshold or last_logging_far_ago:
+            print("logging a new value now.")
+            print(f"change_over_threshold={change_over_threshold}, last_logging_far_ago={last_logging_far_ago}")
+            self.last_logging_time = time.time()
+            for i, writer in enumerate(self.writers):
+                if last_sample and not self.last_sample_stored and change_over_threshold:
+                    # also dump the sample from before so that line plots
+                    # aren't 'cutting the corner' after sudden changes
+                    writer.write_record(self.channel_record(last_sample, i))
+                writer.write_record(self.channel_record(sample, i))
+            self.last_sample_stored = True
+        else:
+            self.last_sample = sample
+            self.last_sample_stored = False
+            for writer in self.writers:
+                writer.maybe_flush()
+
+    def process_swinging_door(self, readings):
+        """ store each channel's samples as decided by its swinging door """
+        sample = readings
+        sample.update({'ts': time.time()})
+        for i, door in enumerate(self.doors):
+            pressure = sample['pressures'][i]
+            y = math.log10(pressure) if pressure > 0 else -math.inf
+            force = sample['ts'] - self.last_stored[i] > self.max_logging_interval
+            for stored in door.add(sample['ts'], y, payload=sample, force=force):
+                self.writers[i].write_record(self.channel_record(stored, i))
+                self.last_stored[i] = stored['ts']
+            self.writers[i].maybe_flush()
+
+    async def capture_stream(self, scan_rate, duration):
+        """
+        Log every scan of the gauge's hardware stream for duration
+        seconds, e.g. to catch the fast first seconds of a pump-down
+        that polling misses. Blocks are written as a whole, the
+        thresholds and the swinging door don't apply.
+        """
+        gauge = self.gauge
+        try:
+            scan_rate = await gauge.call_async(gauge.start_stream, scan_rate)
+        except GaugeError:
+            print(f"{self.plugin}: could not start the stream, polling right away")
+            return
+        print(f"{self.plugin}: streaming at {scan_rate:g} Hz for {duration:g} s")
+        end = time.monotonic() + duration
+        try:
+            while time.monotonic() < end:
+                block = await gauge.call_async(gauge.read_stream)
+                samples = [{'pressures': pressures, 'voltages': voltages, 'ts': ts} for ts, pressures, voltages
+                           in zip(block['ts'].tolist(), block['pressures'].tolist(), block['voltages'].tolist())]
+                for i, writer in enumerate(self.writers):
+                    writer.write_records([self.channel_record(sample, i) for sample in samples])
+                self.metrics.samples += len(samples)
+                if samples:
+                    print(f"{dt.now().isoformat(' ')} {self.plugin} streamed {len(samples)} scans, "
+                          f"last pressure values: {samples[-1]['pressures']} [mbar]")
+        except GaugeError:
+            print(f"{self.plugin}: the stream failed, polling from now on")
+        finally:
+            try:
+                await gauge.call_async(gauge.stop_stream)
+            except GaugeError:
+                pass
+            for writer in self.writers:
+                writer.flush()
+
+    async def run(self):
+        """
+        sample the gauge forever on the ticks of the scheduler,
+        blocking reads run in the gauge's own executor
+        """
+        metrics = self.metrics
+        scheduler = self.scheduler
+        if self.stream and hasattr(self.gauge, 'start_stream'):
+            await self.capture_stream(*self.stream)
+            scheduler.resume()
+        last_read = None
+        while True:
+            skipped_ticks = scheduler.skipped_ticks
+            t = time.perf_counter()
+            jitter = await scheduler.wait()
+            t0 = time.perf_counter()
+            metrics.observe('sleep', t0 - t)
+            metrics.observe_tick(jitter, scheduler.skipped_ticks - skipped_ticks)
+            try:
+                readings = await self.gauge.get_readings_async()
+            except GaugeError:
+                # retry on the next tick
+                metrics.gauge_errors += 1
+                for writer in self.writers:
+                    writer.maybe_flush()
+                continue
+            t1 = time.perf_counter()
+            metrics.observe('read', t1 - t0)
+            metrics.samples += 1
+            if last_read is not None:
+                metrics.observe_interval(t0 - last_read)
+            last_read = t0
+            write_seconds = metrics.write_seconds
+            self.process(readings)
+            metrics.observe('evaluate', time.perf_counter() - t1 - (metrics.write_seconds - write_seconds))
+
+def gauge_spec(spec):
+    """
+    PLUGIN:IDENTIFIER:CHAN[=DESCR][,CHAN[=DESCR]...][:SAMPLING_INTERVAL]
+    e.g. vacom:/dev/ttyUSB0:1=chamber,2=forevacuum or balzers::AIN0=load-lock:0.5
+    or simulated:rate=100,faults=0.01:1,2:0.01 (see simulated_gauge_plugin.py)
+    """
+    import argparse
+    parts = spec.split(':')
+    if len(parts) not in (3, 4) or parts[0] not in GAUGE_PLUGINS or not parts[2]:
+        raise argparse.ArgumentTypeError('invalid gauge specification: %s' % spec)
+    channels = []
+    for chan_descr in parts[2].split(','):
+        chan, _, descr = chan_descr.partition('=')
+        channels.append((chan, descr))
+    interval = float(parts[3]) if len(parts) == 4 else None
+    return {'plugin': parts[0], 'identifier': parts[1], 'channels': channels, 'sampling_interval': interval}
+
+def stream_spec(spec):
+    """ RATE:SECONDS, e.g. 1000:30 """
+    import argparse
+    try:
+        rate, duration = (float(part) for part in spec.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid stream specification: %s' % spec)
+    if rate <= 0 or duration <= 0:
+        raise argparse.ArgumentTypeError('invalid stream specification: %s' % spec)
+    return rate, duration
+
+def sanitize_identifier(identifier):
+    """ the identifier of a gauge as part of a filename, e.g. dev-ttyUSB0 for /dev/ttyUSB0 """
+    return re.sub(r'[^A-Za-z0-9.+-]+', '-', identifier).strip('-') or 'default'
+
+async def write_metrics(loggers, filename, interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            write_prometheus([logger.metrics for logger in loggers], filename)
+        except OSError as e:
+            print(f"could not write the metrics to {filename}: {e}")
+
+async def run_all(loggers, metrics_file=None, metrics_interval=15.):
+    tasks = [logger.run() for logger in loggers]
+    if metrics_file:
+        tasks.append(write_metrics(loggers, metrics_file, metrics_interval))
+    await asyncio.gather(*tasks)
 
 def main():
     import argparse
@@ -17,74 +456,87 @@ def main():
     parser.add_argument('--logging-threshold', '-t', type=float, default=5., help='log whenever the value has changed more then this amount in percent')
     parser.add_argument('--max-logging-interval', '-l', type=float, default=120, help='also log a new value if this amount of seconds has passed')
     parser.add_argument('--sampling-interval', '-s', type=float, default=2, help='also log a new value if this amount of minutes has passed')
-    parser.add_argument('--gauge-plugin', '-g', choices=('vacom', 'balzers'), required=True)
-    parser.add_argument('--channel', '-c', action='append', type=channel_descr, required=True)
+    parser.add_argument('--gauge-plugin', '-g', choices=GAUGE_PLUGINS)
+    parser.add_argument('--channel', '-c', action='append', type=channel_descr)
+    parser.add_argument('--identifier', '-i', default='',
+        help='identifier of the --gauge-plugin gauge: the serial port (vacom) or options like rate=100,noise=0.05 (simulated)')
+    parser.add_argument('--gauge', '-G', action='append', type=gauge_spec, default=[],
+        help='poll another gauge concurrently: ' + gauge_spec.__doc__.strip().split('\n')[0])
+    parser.add_argument('--flush-records', type=int, default=20, help='write the log files at least every this many records')
+    parser.add_argument('--flush-interval', type=float, default=10., help='write the log files at least every this many seconds')
+    parser.add_argument('--swinging-door', '-d', type=float, metavar='MAX_ERROR',
+        help='store a piecewise linear curve (in log-pressure) that deviates less than MAX_ERROR percent from all samples instead of using --logging-threshold')
+    parser.add_argument('--format', '-f', choices=('v1', 'v2'), default='v1', help='v1: JSON lines, v2: binary records (see pumping_curve_v2.py)')
+    parser.add_argument('--no-fsync', action='store_true', help="don't fsync the log files when writing them")
+    parser.add_argument('--overrun', choices=SamplingScheduler.OVERRUN_POLICIES, default='skip',
+        help='when a sample takes longer than the sampling interval: skip the missed samples or catch up on them')
+    parser.add_argument('--stream', type=stream_spec, metavar='RATE:SECONDS',
+        help='capture the start with the hardware stream of the gauges supporting it (%s): '
+             'every scan at RATE Hz for SECONDS, then poll as usual' % ', '.join(STREAMING_PLUGINS))
+    parser.add_argument('--metrics-file', '-m', help='write timing statistics of the acquisition loop to this file (Prometheus text format)')
+    parser.add_argument('--metrics-interval', type=float, default=15., help='update the metrics file every this many seconds')
     parser.add_argument('--help', '-H', action='help', help='show this help message and exit')
     parser.add_argument('logfile', default=dt.now().isoformat().replace(':', '-'))
     args = parser.parse_args()
-    filenames = [f'{args.logfile}_ch{chan[0]}.log' for chan in args.channel]
+    gauges = list(args.gauge)
+    if args.gauge_plugin:
+        if not args.channel:
+            parser.error('--gauge-plugin requires at least one --channel')
+        gauges.insert(0, {'plugin': args.gauge_plugin, 'identifier': args.identifier, 'channels': args.channel, 'sampling_interval': None})
+    elif args.channel:
+        parser.error('--channel requires --gauge-plugin')
+    if not gauges:
+        parser.error('specify a gauge with --gauge-plugin/--channel or --gauge')
+    if args.stream and not any(spec['plugin'] in STREAMING_PLUGINS for spec in gauges):
+        parser.error('--stream needs a gauge of a plugin supporting it: %s' % ', '.join(STREAMING_PLUGINS))
+    start = time.time()
+    # a common origin keeps the samples of all gauges in phase
+    origin = time.monotonic()
+    plugins = [spec['plugin'] for spec in gauges]
+    for spec in gauges:
+        if len(gauges) == 1:
+            prefix = args.logfile
+        elif plugins.count(spec['plugin']) == 1:
+            prefix = f'{args.logfile}_{spec["plugin"]}'
+        else:
+            # several gauges of one plugin are told apart by their identifiers
+            prefix = f'{args.logfile}_{spec["plugin"]}_{sanitize_identifier(spec["identifier"])}'
+        spec['filenames'] = [f'{prefix}_ch{chan[0]}.log' for chan in spec['channels']]
+    all_filenames = [filename for spec in gauges for filename in spec['filenames']]
+    for filename in set(all_filenames):
+        if all_filenames.count(filename) > 1:
+            parser.error('%s would be written by two channels, each channel of a gauge can be logged only once '
+                         'and gauges of the same plugin need different identifiers' % filename)
+    loggers = []
+    for spec in gauges:
+        loggers.append(GaugeLogger(None, spec['plugin'], spec['channels'], spec['filenames'],
+            sampling_interval=spec['sampling_interval'] or args.sampling_interval,
+            logging_threshold=args.logging_threshold,
+            max_logging_interval=args.max_logging_interval,
+            start=start,
+            writer_options={'flush_records': args.flush_records, 'flush_interval': args.flush_interval,
+                            'fsync': not args.no_fsync},
+            file_format=args.format,
+            swinging_door_error=args.swinging_door,
+            identifier=spec['identifier'],
+            origin=origin,
+            overrun=args.overrun,
+            stream=args.stream))
     if args.write_header:
-        for i, chan in enumerate(args.channel):
-            with open(filenames[i], 'a') as f:
-                f.write('# vacuum_pumping_curve v1.0.0 \n')
-                f.write(json.dumps({'filetype': 'vacuum_pumping_curve', 'version': 'v1.0.0'}) + '\n')
-                f.write(json.dumps({'gauge_plugin': args.gauge_plugin, 'channel': chan}) + '\n')
-                f.write(json.dumps({'action': 'pumping_started', 'ts': time.time(), 'comment': ''}) + '\n')
+        for logger in loggers:
+            logger.write_header()
     try:
-        start = time.time()
-        last_sampling_time = 0.0
-        last_logging_time = 0.0
-        last_sample = None
-        last_sample_stored = False
-        if args.gauge_plugin == 'balzers':
-            gauge = balzers_pkg020_plugin.BalzersPkg020(identifier='',channels=[ch[0] for ch in args.channel])
-        elif args.gauge_plugin == 'vacom':
-            gauge = vacom_mvc3_plugin.VacomMvc3(identifier='/dev/ttyUSB0', channels=[ch[0] for ch in args.channel])
-        while True:
-            try:
-                readings = gauge.get_readings()
-            except GaugeError:
-                time.sleep(1.0)
-                continue
-            last_sampling_time = time.time()
-            pressures = readings['pressures']
-            print(f"{dt.now().isoformat(' ')} {time.time() - start:.1f} pressure values: {pressures} [mbar]")
-            change_over_threshold = False
-            if last_sample:
-                for i in range(len(pressures)):
-                    if abs((pressures[i] - last_sample['pressures'][i]) / last_sample['pressures'][i]) * 100 > args.logging_threshold:
-                        change_over_threshold = True
-            last_logging_far_ago = time.time() - last_logging_time > args.max_logging_interval
-            sample = readings
-            sample.update({'ts': time.time()})
-            if change_over_threshold or last_logging_far_ago:
-                print("logging a new value now.")
-                print(f"change_over_threshold={change_over_threshold}, last_logging_far_ago={last_logging_far_ago}")
-                last_logging_time = time.time()
-                last_value = pressures
-                for i, chan in enumerate(args.channel):
-                    with open(filenames[i], 'a') as f:
-                        if last_sample and not last_sample_stored and change_over_threshold:
-                            last_sample_copy = copy.copy(last_sample)
-                            last_sample_copy['pressure'] = last_sample_copy['pressures'][i]
-                            del last_sample_copy['pressures']
-                            # also dump the sample from before so that line plots
-                            # aren't 'cutting the corner' after sudden changes
-                            json.dump(last_sample_copy, f)
-                            f.write('\n')
-                        sample_copy = copy.copy(sample)
-                        sample_copy['pressure'] = sample_copy['pressures'][i]
-                        del sample_copy['pressures']
-                        json.dump(sample_copy, f)
-                        f.write('\n')
-                last_sample_stored = True
-            else:
-                last_sample = sample
-                last_sample_stored = False
-            time_since_last_sampling = time.time() - last_sampling_time
-            time.sleep(args.sampling_interval - time_since_last_sampling)
+        for spec, logger in zip(gauges, loggers):
+            logger.gauge = open_gauge(spec['plugin'], spec['identifier'], channels=[ch[0] for ch in spec['channels']])
+        asyncio.run(run_all(loggers, metrics_file=args.metrics_file, metrics_interval=args.metrics_interval))
     except KeyboardInterrupt:
         pass
+    finally:
+        for logger in loggers:
+            logger.close()
+        if args.metrics_file:
+            write_prometheus([logger.metrics for logger in loggers], args.metrics_file)
+        print('\n'.join(logger.metrics.summary() for logger in loggers))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""
+The vacuum_pumping_curve v2.0.0 file format.
+
+    # vacuum_pumping_curve v2.0.0
+    {"filetype": "vacuum_pumping_curve", "version": "v2.0.0", "fields": ["ts", "pressure"], ...}
+    # data
+    <fixed-width little-endian float64 records, one field after the other>
+
+The JSON header line carries what the header lines of v1.0.0 files
+hold (gauge_plugin, channel, pumping_started, comment). The records
+start right after the "# data" line and can be memory-mapped as they
+are. A partially written last record is ignored when reading.
+
+Run this module to convert v1.0.0 logs to v2.0.0.
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+
+from refcurve_archive import open_refcurve, is_compressed
+
+MAGIC = b'# vacuum_pumping_curve v2.0.0\n'
+DATA_MARKER = b'# data\n'
+FIELDS = ('ts', 'pressure', 'voltage')
+
+def record_dtype(fields):
+    return np.dtype([(field, '<f8') for field in fields])
+
+def is_v2(filename):
+    with open_refcurve(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def make_header(fields=('ts', 'pressure'), gauge_plugin=None, channel=None, pumping_started=None, comment=''):
+    return {'filetype': 'vacuum_pumping_curve', 'version': 'v2.0.0', 'fields': list(fields),
+            'gauge_plugin': gauge_plugin, 'channel': channel,
+            'pumping_started': pumping_started, 'comment': comment}
+
+def write_header(f, header):
+    f.write(MAGIC)
+    f.write(json.dumps(header).encode('utf-8') + b'\n')
+    f.write(DATA_MARKER)
+
+def read_header(f):
+    """ Returns the header dict and the offset of the first record """
+    if f.readline() != MAGIC:
+        raise ValueError('not a vacuum_pumping_curve v2.0.0 file')
+    header = json.loads(f.readline())
+    if f.readline() != DATA_MARKER:
+        raise ValueError('missing data marker in vacuum_pumping_curve v2.0.0 file')
+    return header, f.tell()
+
+def load(filename):
+    """
+    Returns the header and a read-only memory map of the complete records.
+    Compressed files are decompressed into memory instead.
+    """
+    if is_compressed(filename):
+        with open_refcurve(filename, 'rb') as f:
+            header, offset = read_header(f)
+            data = f.read()
+        dtype = record_dtype(header['fields'])
+        return header, np.frombuffer(data, dtype=dtype, count=len(data) // dtype.itemsize)
+    with open(filename, 'rb') as f:
+        header, offset = read_header(f)
+        size = os.fstat(f.fileno()).st_size
+    dtype = record_dtype(header['fields'])
+    count = (size - offset) // dtype.itemsize
+    if count == 0:
+        return header, np.zeros(0, dtype=dtype)
+    return header, np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+def convert_v1(source, destination):
+    """ Convert the v1.0.0 log source to a v2.0.0 file destination """
+    from refcurves import parse_refcurve
+    header = make_header()
+    with open_refcurve(source, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line.startswith('{'):
+                continue
+            chunk = json.loads(line)
+            if 'pressure' in chunk:
+                break
+            if 'gauge_plugin' in chunk:
+                header['gauge_plugin'] = chunk['gauge_plugin']
+                header['channel'] = chunk.get('channel')
+            if chunk.get('action') == 'pumping_started' and header['pumping_started'] is None:
+                header['pumping_started'] = chunk['ts']
+                header['comment'] = chunk.get('comment', '')
+    timestamps, pressure, first_start = parse_refcurve(source)
+    if header['pumping_started'] is None and not math.isnan(first_start):
+        header['pumping_started'] = first_start
+    records = np.empty(len(timestamps), dtype=record_dtype(header['fields']))
+    records['ts'] = timestamps
+    records['pressure'] = pressure
+    tmp_destination = destination + '.tmp'
+    with open(tmp_destination, 'wb') as f:
+        write_header(f, header)
+        f.write(records.tobytes())
+    os.replace(tmp_destination, destination)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert vacuum_pumping_curve v1.0.0 logs to v2.0.0')
+    parser.add_argument('--in-place', '-i', action='store_true', help='replace the v1.0.0 files')
+    parser.add_argument('logfile', nargs='+')
+    args = parser.parse_args()
+    if args.in_place:
+        compressed = [source for source in args.logfile if is_compressed(source)]
+        if compressed:
+            parser.error('the v2.0.0 files are written uncompressed, not replacing the compressed %s' % ', '.join(compressed))
+    for source in args.logfile:
+        if is_v2(source):
+            print(f"{source}: already v2.0.0")
+            continue
+        if args.in_place:
+            destination = source
+        else:
+            # c.log.gz -> c.v2.log, the output isn't compressed
+            name = os.path.splitext(source)[0] if is_compressed(source) else source
+            root, ext = os.path.splitext(name)
+            destination = root + '.v2' + ext
+        size = os.path.getsize(source)
+        convert_v1(source, destination)
+        print(f"{source} -> {destination}: {size} -> {os.path.getsize(destination)} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""
+Compressed reference curve logs (.log.gz, .log.xz and .log.zst).
+
+open_refcurve() opens plain and compressed logs alike, decompressing
+while reading so that memory use stays flat. Run this module to
+compress the logs of a tree that haven't changed for some days.
+.zst needs the zstandard package.
+"""
+
+import gzip
+import io
+import lzma
+import os
+import shutil
+import sys
+import time
+
+COMPRESSED_EXTENSIONS = ('.gz', '.xz', '.zst')
+REFCURVE_EXTENSIONS = ('.log',) + tuple('.log' + extension for extension in COMPRESSED_EXTENSIONS)
+
+def is_refcurve_filename(name):
+    return name.endswith(REFCURVE_EXTENSIONS)
+
+def is_compressed(filename):
+    return filename.endswith(COMPRESSED_EXTENSIONS)
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('reading and writing .zst files requires the zstandard package')
+    return zstandard
+
+def read_errors():
+    """
+    The exceptions reading a broken log can raise: OSError, and ValueError,
+    KeyError or TypeError for malformed records, plus the errors of the
+    decompressors for truncated or corrupt streams or a missing zstandard.
+    """
+    errors = (OSError, ValueError, KeyError, TypeError, EOFError, lzma.LZMAError, ImportError)
+    zstandard = sys.modules.get('zstandard')
+    if zstandard is not None:
+        errors += (zstandard.ZstdError,)
+    return errors
+
+def open_refcurve(filename, mode='rb'):
+    """ open a (possibly compressed) log for reading in mode 'rb' or 'r' """
+    if filename.endswith('.gz'):
+        f = gzip.open(filename, 'rb')
+    elif filename.endswith('.xz'):
+        f = lzma.open(filename, 'rb')
+    elif filename.endswith('.zst'):
+        f = io.BufferedReader(_zstandard().ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True))
+    else:
+        f = open(filename, 'rb')
+    if mode == 'r':
+        return io.TextIOWrapper(f, encoding='utf-8')
+    return f
+
+def _open_compressed_for_writing(filename, extension):
+    if extension == '.gz':
+        return gzip.open(filename, 'wb')
+    elif extension == '.xz':
+        return lzma.open(filename, 'wb')
+    elif extension == '.zst':
+        return _zstandard().ZstdCompressor(level=10).stream_writer(open(filename, 'wb'), closefd=True)
+    raise ValueError('unknown compression: %s' % extension)
+
+def compress_log(filename, extension='.xz'):
+    """
+    Replace filename by filename + extension. The modification time
+    is kept so that the age of the log stays visible.
+    """
+    destination = filename + extension
+    tmp_destination = destination + '.tmp'
+    stat = os.stat(filename)
+    with open(filename, 'rb') as source, _open_compressed_for_writing(tmp_destination, extension) as f:
+        shutil.copyfileobj(source, f, 1 << 20)
+    os.utime(tmp_destination, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(tmp_destination, destination)
+    os.remove(filename)
+    return destination
+
+def archive(root_directory, min_age_days=30, extension='.xz', dry_run=False):
+    """ compress all plain logs below root_directory older than min_age_days """
+    threshold = time.time() - min_age_days * 24 * 3600
+    for dirpath, dirnames, filenames in os.walk(root_directory):
+        for name in sorted(filenames):
+            if not name.endswith('.log'):
+                continue
+            filename = os.path.join(dirpath, name)
+            if os.path.getmtime(filename) > threshold:
+                continue
+            size = os.path.getsize(filename)
+            if dry_run:
+                print(f"would compress {filename} ({size} bytes)")
+                continue
+            destination = compress_log(filename, extension=extension)
+            print(f"{filename} -> {destination}: {size} -> {os.path.getsize(destination)} bytes")
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Compress reference curve logs that are no longer written to')
+    parser.add_argument('--days', '-d', type=float, default=30, help='only compress logs not modified for this many days')
+    parser.add_argument('--compression', '-c', choices=('gz', 'xz', 'zst'), default='xz')
+    parser.add_argument('--dry-run', '-n', action='store_true', help='only list the logs that would be compressed')
+    parser.add_argument('root_directory', nargs='?', default='./data_v1.1.0')
+    args = parser.parse_args()
+    archive(args.root_directory, min_age_days=args.days, extension='.' + args.compression, dry_run=args.dry_run)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+"""
+Persistent SQLite index of a reference curve directory tree.
+
+Rescanning only lists directories whose mtime has changed since the
+last scan, the others are taken from the index. Appending to a log
+doesn't change the mtime of its directory, so the indexed files of
+unchanged directories are stat()ed again. Directories of one level of
+the tree are scanned in parallel, which helps a lot on network mounts
+where every stat() is a round trip.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import refcurves
+from refcurves import get_refcurve, get_refcurve_metadata, get_thumbnail, refcurve_milestones
+from refcurve_archive import is_refcurve_filename, read_errors
+
+# bump whenever SCHEMA changes, the index is rebuilt from scratch then
+SCHEMA_VERSION = 3
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    parent TEXT,
+    name TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    has_icon INTEGER NOT NULL,
+    PRIMARY KEY (root, path)
+);
+CREATE TABLE IF NOT EXISTS files (
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    metadata TEXT,
+    milestone_levels TEXT,
+    milestones TEXT,
+    PRIMARY KEY (root, path)
+);
+CREATE INDEX IF NOT EXISTS files_directory ON files (root, directory);
+"""
+
+def _stat_known_files(full_path, known_files):
+    """ (name, size, mtime_ns) of the known_files that changed, size and mtime_ns None if removed """
+    modified = []
+    for name, size, mtime_ns in known_files:
+        try:
+            stat = os.stat(os.path.join(full_path, name))
+        except FileNotFoundError:
+            modified.append((name, None, None))
+            continue
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            modified.append((name, stat.st_size, stat.st_mtime_ns))
+    return modified
+
+def _scan_directory(root, path, known_mtime_ns, known_files=()):
+    """
+    List a single directory (path relative to root).
+    If its mtime matches known_mtime_ns, the listing is None and only
+    the known_files (name, size, mtime_ns) are checked for changes.
+    """
+    full_path = os.path.join(root, path)
+    try:
+        mtime_ns = os.stat(full_path).st_mtime_ns
+    except FileNotFoundError:
+        # removed while scanning
+        return path, None, None, None
+    if mtime_ns == known_mtime_ns:
+        return path, mtime_ns, None, _stat_known_files(full_path, known_files)
+    subdirectories, files, has_icon = [], [], False
+    for entry in os.scandir(full_path):
+        if entry.is_dir():
+            subdirectories.append(entry.name)
+        elif entry.is_file():
+            if entry.name == 'icon.svg':
+                has_icon = True
+            if is_refcurve_filename(entry.name):
+                stat = entry.stat()
+                files.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return path, mtime_ns, (subdirectories, files, has_icon), None
+
+def _extract_milestones(root, path, levels):
+    """
+    The milestones of a curve, plus its exact point count and minimum
+    pressure from the same load (the metadata only estimates them).
+    """
+    try:
+        rc = get_refcurve(os.path.join(root, path))
+    except FileNotFoundError:
+        # removed meanwhile
+        return path, None, None
+    except read_errors() as e:
+        # a malformed record or a broken archive, the file stays in the tree without milestones
+        print("Could not read the milestones of %s: %r" % (os.path.join(root, path), e), file=sys.stderr)
+        return path, None, None
+    exact = {'point_count': len(rc.pressure), 'point_count_estimated': False,
+             'min_pressure': float(rc.pressure.min()) if len(rc.pressure) else None}
+    return path, json.dumps(refcurve_milestones(rc, levels)), exact
+
+def _extract_metadata(root, path):
+    try:
+        metadata = get_refcurve_metadata(os.path.join(root, path))
+    except FileNotFoundError:
+        # removed meanwhile
+        return path, None
+    except read_errors() as e:
+        # a malformed record or a broken archive, keep the file in the tree without metadata
+        print("Could not read the metadata of %s: %r" % (os.path.join(root, path), e), file=sys.stderr)
+        return path, None
+    del metadata['filename']
+    return path, json.dumps(metadata)
+
+class RefcurveIndex:
+    """
+    Besides the metadata, the index keeps the time each curve took to
+    reach the milestone_pressures (see refcurves.time_to_pressure()).
+    They are computed once per modified log, or when the pressures change.
+    """
+
+    def __init__(self, db_filename, max_workers=8, milestone_pressures=None):
+        self.db_filename = db_filename
+        self.max_workers = max_workers
+        self.milestone_pressures = list(milestone_pressures or refcurves.MILESTONE_PRESSURES)
+        self.db = sqlite3.connect(db_filename)
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.db.executescript('DROP TABLE IF EXISTS directories; DROP TABLE IF EXISTS files;')
+            self.db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, root_directory):
+        """ Incrementally bring the index of root_directory up to date """
+        root = os.path.abspath(root_directory)
+        db = self.db
+        known = dict(db.execute('SELECT path, mtime_ns FROM directories WHERE root = ?', (root,)))
+        known_files = {}
+        for directory, name, size, mtime_ns in db.execute(
+                'SELECT directory, name, size, mtime_ns FROM files WHERE root = ?', (root,)):
+            known_files.setdefault(directory, []).append((name, size, mtime_ns))
+        seen = set()
+        outdated_metadata = []
+        # the root itself isn't part of the tree, only the folders in it
+        level = [entry.name for entry in os.scandir(root) if entry.is_dir()]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool, db:
+            while level:
+                next_level = []
+                scans = pool.map(lambda path: _scan_directory(root, path, known.get(path), known_files.get(path, ())), level)
+                for path, mtime_ns, listing, modified in scans:
+                    if mtime_ns is None:
+                        continue
+                    seen.add(path)
+                    if listing is None:
+                        for name, size, file_mtime_ns in modified:
+                            file_path = os.path.join(path, name)
+                            if size is None:
+                                db.execute('DELETE FROM files WHERE root = ? AND path = ?', (root, file_path))
+                                continue
+                            db.execute('UPDATE files SET size = ?, mtime_ns = ?, metadata = NULL, '
+                                'milestone_levels = NULL, milestones = NULL WHERE root = ? AND path = ?',
+                                (size, file_mtime_ns, root, file_path))
+                            outdated_metadata.append(file_path)
+                        subdirectories = [row[0] for row in db.execute(
+                            'SELECT path FROM directories WHERE root = ? AND parent = ?', (root, path))]
+                        next_level.extend(subdirectories)
+                        continue
+                    subdirectories, files, has_icon = listing
+                    parent, name = os.path.split(path)
+                    db.execute('INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?, ?)',
+                        (root, path, parent, name, mtime_ns, has_icon))
+                    # keep the metadata and milestones of files that didn't change
+                    previous = {(name, size, file_mtime_ns): (metadata, milestone_levels, milestones)
+                                for name, size, file_mtime_ns, metadata, milestone_levels, milestones in db.execute(
+                        'SELECT name, size, mtime_ns, metadata, milestone_levels, milestones FROM files '
+                        'WHERE root = ? AND directory = ?', (root, path))}
+                    db.execute('DELETE FROM files WHERE root = ? AND directory = ?', (root, path))
+                    rows = []
+                    for file in files:
+                        known_file = previous.get(file, (None, None, None))
+                        if known_file[0] is None:
+                            outdated_metadata.append(os.path.join(path, file[0]))
+                        rows.append((root, os.path.join(path, file[0]), path) + file + known_file)
+                    db.executemany('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                    next_level.extend(os.path.join(path, name) for name in subdirectories)
+                level = next_level
+            for path in set(known) - seen:
+                db.execute('DELETE FROM directories WHERE root = ? AND path = ?', (root, path))
+                db.execute('DELETE FROM files WHERE root = ? AND directory = ?', (root, path))
+            extracted = pool.map(lambda path: _extract_metadata(root, path), outdated_metadata)
+            db.executemany('UPDATE files SET metadata = ? WHERE root = ? AND path = ?',
+                [(metadata, root, path) for path, metadata in extracted])
+            # new and modified files, or all of them if the milestone pressures changed
+            levels = json.dumps(self.milestone_pressures)
+            outdated_milestones = [row[0] for row in db.execute(
+                'SELECT path FROM files WHERE root = ? AND milestone_levels IS NOT ?', (root, levels))]
+            extracted = list(pool.map(lambda path: _extract_milestones(root, path, self.milestone_pressures), outdated_milestones))
+            db.executemany('UPDATE files SET milestone_levels = ?, milestones = ? WHERE root = ? AND path = ?',
+                [(levels, milestones, root, path) for path, milestones, exact in extracted])
+            for path, milestones, exact in extracted:
+                metadata = db.execute('SELECT metadata FROM files WHERE root = ? AND path = ?', (root, path)).fetchone()
+                if exact and metadata and metadata[0]:
+                    db.execute('UPDATE files SET metadata = ? WHERE root = ? AND path = ?',
+                        (json.dumps(dict(json.loads(metadata[0]), **exact)), root, path))
+
+    def tree(self, root_directory):
+        """ The indexed tree in the format of refcurves.get_refcurves_metadata() """
+        root = os.path.abspath(root_directory)
+        directories = {}
+        children = {}
+        for path, parent, name, has_icon in self.db.execute(
+                'SELECT path, parent, name, has_icon FROM directories WHERE root = ?', (root,)):
+            dirname = os.path.join(root_directory, path)
+            entry = {'name': name, 'dirname': dirname, 'children': []}
+            if has_icon:
+                entry['icon'] = os.path.join(dirname, 'icon.svg')
+            directories[path] = entry
+            children.setdefault(parent, []).append(entry)
+        for path, directory, name, metadata, milestone_levels, milestones in self.db.execute(
+                'SELECT path, directory, name, metadata, milestone_levels, milestones FROM files '
+                'WHERE root = ?', (root,)):
+            entry = {'filename': os.path.join(root_directory, path), 'date': '', 'name': name}
+            if metadata:
+                entry.update(json.loads(metadata))
+            if milestones:
+                # {pressure: seconds to reach it or None}
+                entry['milestones'] = dict(zip(json.loads(milestone_levels), json.loads(milestones)))
+            # thumbnails are rendered separately (export_plots.py), so they're looked up each time,
+            # against the current mtime of the log as the one in the index may be outdated by now
+            thumbnail = get_thumbnail(entry['filename'])
+            if thumbnail:
+                entry['thumbnail'] = thumbnail
+            children.setdefault(directory, []).append(entry)
+        for path, entry in directories.items():
+            entry['children'] = children.get(path, [])
+            entry['children'].sort(key=lambda x: x['name'])
+        data = children.get('', [])
+        data.sort(key=lambda x: x['name'])
+        return data
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Update the index of a reference curve tree')
+    parser.add_argument('--index', default='refcurves_index.sqlite', help='index database file')
+    parser.add_argument('--rank', '-r', type=float, metavar='PRESSURE',
+        help='list the curves by the time they took to reach PRESSURE (mbar)')
+    parser.add_argument('root_directory', nargs='?', default='./data_v1.1.0')
+    args = parser.parse_args()
+    if args.rank is not None and args.rank not in refcurves.MILESTONE_PRESSURES:
+        parser.error('%g mbar is not one of the milestone pressures, add it to REFCURVES_MILESTONES' % args.rank)
+    index = RefcurveIndex(args.index)
+    index.update(args.root_directory)
+    tree = index.tree(args.root_directory)
+    index.close()
+    if args.rank is None:
+        for entry in tree:
+            print(entry['dirname'])
+        return
+    def curves(entries):
+        for entry in entries:
+            if 'children' in entry:
+                yield from curves(entry['children'])
+            else:
+                yield entry
+    times = [(entry.get('milestones', {}).get(args.rank), entry['filename']) for entry in curves(tree)]
+    for seconds, filename in sorted(times, key=lambda x: (x[0] is None, x[0] or 0.)):
+        print(f"{'not reached' if seconds is None else timedelta(seconds=round(seconds))!s:>14}  {filename}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+"""
+Find the reference curves closest to a (possibly still running) pump-down.
+
+All reference curves are resampled onto one log-spaced grid of the time
+elapsed since the start of pumping and kept as rows of a single matrix
+of log10(pressure), NaN where a curve has no data. A query is resampled
+the same way and compared with every row at once: the score is the RMS
+difference in log10(pressure) over the grid points both curves cover,
+so a running pump-down is compared with the beginning of the references.
+
+The grid ends at GRID_MAX_ELAPSED (about 16 weeks, --grid-days changes
+it) and anything pumped longer than that is not compared. The matrix is
+cached next to the sidecar caches and only the rows of new or modified
+logs are recomputed; a cache built on another grid is rebuilt.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import refcurves
+from refcurve_archive import is_refcurve_filename, read_errors
+
+# long enough for multi-week pump-downs
+GRID_MAX_ELAPSED = 1e7
+# grid points per decade of elapsed time
+GRID_DENSITY = 40
+
+def elapsed_grid(t_min=1., t_max=GRID_MAX_ELAPSED, points_per_decade=GRID_DENSITY):
+    """ log-spaced elapsed times in seconds """
+    n_points = int(round(np.log10(t_max / t_min) * points_per_decade)) + 1
+    return np.geomspace(t_min, t_max, n_points)
+
+def resample(elapsed, pressure, grid):
+    """ log10(pressure) at the grid points within the range of elapsed, NaN elsewhere """
+    elapsed = np.asarray(elapsed, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_pressure = np.log10(np.asarray(pressure, dtype=np.float64))
+    usable = np.isfinite(elapsed) & np.isfinite(log_pressure)
+    elapsed, log_pressure = elapsed[usable], log_pressure[usable]
+    result = np.full(len(grid), np.nan)
+    if len(elapsed) < 2:
+        return result
+    if np.any(np.diff(elapsed) < 0):
+        order = np.argsort(elapsed, kind='stable')
+        elapsed, log_pressure = elapsed[order], log_pressure[order]
+    inside = (grid >= elapsed[0]) & (grid <= elapsed[-1])
+    result[inside] = np.interp(grid[inside], elapsed, log_pressure)
+    return result
+
+def _resample_refcurve(rc, grid):
+    start = rc.start
+    if not np.isfinite(start):
+        # no pumping_started record, count from the first sample
+        start = rc.timestamps[0] if len(rc.timestamps) else 0.
+    return resample(rc.timestamps - start, rc.pressure, grid)
+
+def _load_row(filename, grid):
+    try:
+        stat = os.stat(filename)
+        rc = refcurves.get_refcurve(filename)
+    except read_errors():
+        return filename, None, None
+    return filename, (stat.st_size, stat.st_mtime_ns), _resample_refcurve(rc, grid).astype(np.float32)
+
+class ReferenceMatrix:
+    """
+    The reference curves resampled onto grid, one row per filename.
+
+    update() brings the rows in line with a list of logs, match() ranks
+    them against a query.
+    """
+
+    def __init__(self, grid=None, cache_filename=None, max_workers=8):
+        self.grid = elapsed_grid() if grid is None else np.asarray(grid, dtype=np.float64)
+        if cache_filename is None and refcurves.CACHE_DIRECTORY:
+            cache_filename = os.path.join(refcurves.CACHE_DIRECTORY, 'reference_matrix.npz')
+        self.cache_filename = cache_filename
+        self.max_workers = max_workers
+        self.filenames = []
+        self.stats = np.zeros((0, 2), dtype=np.int64)
+        self.matrix = np.zeros((0, len(self.grid)), dtype=np.float32)
+        self._load_cache()
+
+    def _load_cache(self):
+        if not self.cache_filename:
+            return
+        try:
+            with np.load(self.cache_filename) as cache:
+                if not np.array_equal(cache['grid'], self.grid):
+                    return
+                self.filenames = [str(filename) for filename in cache['filenames']]
+                self.stats = cache['stats']
+                self.matrix = cache['matrix']
+        except (OSError, KeyError, ValueError):
+            pass
+
+    def _store_cache(self):
+        if not self.cache_filename:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_filename), exist_ok=True)
+            tmp_filename = self.cache_filename + '.tmp.npz'
+            np.savez(tmp_filename, grid=self.grid, filenames=np.array(self.filenames, dtype=str),
+                     stats=self.stats, matrix=self.matrix)
+            os.replace(tmp_filename, self.cache_filename)
+        except OSError:
+            # caching is an optimization only
+            pass
+
+    def update(self, filenames):
+        """ make the rows match filenames, resampling only new or modified logs """
+        filenames = [os.path.abspath(filename) for filename in filenames]
+        rows = {filename: i for i, filename in enumerate(self.filenames)}
+        keep, outdated = {}, []
+        for filename in filenames:
+            i = rows.get(filename)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            if i is not None and tuple(self.stats[i]) == (stat.st_size, stat.st_mtime_ns):
+                keep[filename] = i
+            else:
+                outdated.append(filename)
+        if not outdated and len(keep) == len(self.filenames):
+            return
+        new_rows = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for filename, stat, row in pool.map(lambda filename: _load_row(filename, self.grid), outdated):
+                if row is not None:
+                    new_rows[filename] = (stat, row)
+        names = [filename for filename in filenames if filename in keep or filename in new_rows]
+        matrix = np.empty((len(names), len(self.grid)), dtype=np.float32)
+        stats = np.empty((len(names), 2), dtype=np.int64)
+        for j, filename in enumerate(names):
+            if filename in keep:
+                matrix[j] = self.matrix[keep[filename]]
+                stats[j] = self.stats[keep[filename]]
+            else:
+                stats[j], matrix[j] = new_rows[filename]
+        self.filenames, self.stats, self.matrix = names, stats, matrix
+        self._store_cache()
+
+    def match(self, elapsed, pressure, top=10, max_elapsed=None, min_overlap=8, exclude=()):
+        """
+        Rank the references by their RMS distance in log10(pressure) to
+        the query curve (elapsed seconds, pressure). Only the grid points
+        covered by the query (and before max_elapsed) are compared, and a
+        reference needs min_overlap of them to be ranked at all.
+
+        Returns up to top dicts with filename, rms (decades of pressure)
+        and overlap (number of grid points compared).
+        """
+        query = resample(elapsed, pressure, self.grid)
+        if max_elapsed is not None:
+            query[self.grid > max_elapsed] = np.nan
+        # the query covers a contiguous range of the grid, a slice avoids copying the matrix
+        columns = np.flatnonzero(np.isfinite(query))
+        if len(columns):
+            columns = slice(columns[0], columns[-1] + 1)
+        diff = self.matrix[:, columns] - query[columns].astype(np.float32)
+        missing = np.isnan(diff)
+        overlap = diff.shape[1] - missing.sum(axis=1)
+        diff[missing] = 0.
+        squared = np.square(diff, out=diff).sum(axis=1, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rms = np.sqrt(squared / overlap)
+        rms[overlap < min_overlap] = np.inf
+        rows = {filename: i for i, filename in enumerate(self.filenames)} if exclude else {}
+        for filename in exclude:
+            i = rows.get(os.path.abspath(filename))
+            if i is not None:
+                rms[i] = np.inf
+        candidates = np.flatnonzero(np.isfinite(rms))
+        if len(candidates) > top:
+            candidates = candidates[np.argpartition(rms[candidates], top)[:top]]
+        candidates = candidates[np.argsort(rms[candidates], kind='stable')]
+        return [{'filename': self.filenames[i], 'rms': float(rms[i]), 'overlap': int(overlap[i])}
+                for i in candidates]
+
+    def match_refcurve(self, rc, **kwargs):
+        """ match() for a ReferenceCurve, which is excluded from the results itself """
+        start = rc.start if np.isfinite(rc.start) else (rc.timestamps[0] if len(rc.timestamps) else 0.)
+        kwargs.setdefault('exclude', (rc.filename,))
+        return self.match(rc.timestamps - start, rc.pressure, **kwargs)
+
+def find_refcurves(root_directory):
+    for dirpath, dirnames, filenames in os.walk(root_directory):
+        for name in filenames:
+            if is_refcurve_filename(name):
+                yield os.path.join(dirpath, name)
+
+def main():
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description='List the reference curves closest to a pump-down')
+    parser.add_argument('logfile', help='the pump-down to compare, may still be running')
+    parser.add_argument('--root-directory', '-r', default='./data_v1.1.0', help='the reference curves')
+    parser.add_argument('--top', '-n', type=int, default=10, help='number of matches to list')
+    parser.add_argument('--max-elapsed', '-m', type=float, help='only compare the first this many seconds')
+    parser.add_argument('--grid-days', type=float, default=GRID_MAX_ELAPSED / 86400,
+        help='compare the curves up to this many days after the start of pumping (default: %(default).0f)')
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    references = ReferenceMatrix(grid=elapsed_grid(t_max=args.grid_days * 86400))
+    references.update(find_refcurves(args.root_directory))
+    t1 = time.perf_counter()
+    rc = refcurves.get_refcurve(args.logfile)
+    matches = references.match_refcurve(rc, top=args.top, max_elapsed=args.max_elapsed)
+    t2 = time.perf_counter()
+    for match in matches:
+        print(f"{match['rms']:8.4f} decades ({10 ** match['rms']:.3g}x) over {match['overlap']:3d} points  {match['filename']}")
+    print(f"{len(references.filenames)} references, updated in {t1 - t0:.3f} s, matched in {(t2 - t1) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
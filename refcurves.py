@@ -1,18 +1,160 @@
 #!/usr/bin/env python
 
 import attr
-from typing import List, Tuple
+import numpy as np
+from typing import Tuple
 from datetime import datetime as dt
 import json
 import os
 import glob
+import math
+import re
+import sys
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
 
-def get_refcurve_metadata(reffile):
-    with open(reffile) as f:
-        pass #print(f.read())
-    return {'filename': reffile, 'date': 'date', 'name': 'name', 'comment': 'comment'}
+import pumping_curve_v2
+from refcurve_archive import open_refcurve, is_compressed, is_refcurve_filename, read_errors
 
-def get_refcurves_metadata(root_directory='./data_v1.1.0'):
+# Directory for the binary sidecar caches of parsed reference curves.
+# Kept outside of the data tree so that read-only archives work, too.
+# Set to None to disable caching.
+CACHE_DIRECTORY = os.environ.get('REFCURVES_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'vacuum_reference_curves'))
+# SQLite index of the reference curve tree, see refcurve_index.py
+INDEX_FILENAME = os.environ.get('REFCURVES_INDEX',
+    CACHE_DIRECTORY and os.path.join(CACHE_DIRECTORY, 'index.sqlite'))
+# pressures (mbar) for which the index keeps the time it took to reach them
+MILESTONE_PRESSURES = tuple(float(level) for level in
+    os.environ.get('REFCURVES_MILESTONES', '1e-3,1e-5,1e-7').split(','))
+
+def _parse_record(line):
+    line = line.strip()
+    if not line.startswith('{'):
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+def get_refcurve_metadata(reffile, max_header_lines=100, tail_size=8192):
+    """
+    Extract metadata of a log file without loading the whole curve.
+
+    Only the header lines up to the first pressure record and the last
+    tail_size bytes of the file are parsed. The point count and the
+    minimum pressure are exact if the curve is in the sidecar cache,
+    otherwise the point count is estimated from the record length
+    near the end of the file (point_count_estimated) and the minimum
+    pressure is unknown (None).
+    """
+    meta = {'filename': reffile, 'name': os.path.basename(reffile), 'date': '', 'comment': '',
+            'start': float('nan'), 'gauge_plugin': None, 'channel': None,
+            'duration': float('nan'), 'point_count': 0, 'point_count_estimated': False,
+            'first_pressure': None, 'last_pressure': None, 'min_pressure': None}
+    if pumping_curve_v2.is_v2(reffile):
+        return _get_refcurve_metadata_v2(reffile, meta)
+    first_record = None
+    header_bytes = 0
+    with open_refcurve(reffile, 'rb') as f:
+        for _ in range(max_header_lines):
+            raw = f.readline()
+            if not raw:
+                break
+            chunk = _parse_record(raw.decode('utf-8', 'replace'))
+            if chunk is None:
+                header_bytes += len(raw)
+                continue
+            if 'pressure' in chunk:
+                first_record = chunk
+                break
+            header_bytes += len(raw)
+            if 'gauge_plugin' in chunk:
+                meta['gauge_plugin'] = chunk['gauge_plugin']
+                meta['channel'] = chunk.get('channel')
+            if chunk.get('action') == 'pumping_started' and math.isnan(meta['start']):
+                meta['start'] = chunk['ts']
+                meta['comment'] = chunk.get('comment', '')
+        if is_compressed(reffile):
+            # no seeking in compressed streams, keep the end while decompressing
+            tail = b''
+            size = f.tell()
+            for block in iter(lambda: f.read(1 << 20), b''):
+                size += len(block)
+                tail = (tail + block)[-tail_size:]
+            tail_start = max(header_bytes, size - len(tail))
+        else:
+            size = os.path.getsize(reffile)
+            tail_start = max(header_bytes, size - tail_size)
+            f.seek(tail_start)
+            tail = f.read()
+        tail = tail.decode('utf-8', 'replace').split('\n')
+    if tail_start > header_bytes:
+        # the first line in the tail block is most likely cut off
+        tail = tail[1:]
+    tail_records = [chunk for chunk in map(_parse_record, tail) if chunk and 'pressure' in chunk]
+    if first_record is None:
+        return meta
+    last_record = tail_records[-1] if tail_records else first_record
+    if math.isnan(meta['start']):
+        meta['start'] = first_record['ts']
+    meta['date'] = dt.fromtimestamp(meta['start']).strftime('%Y-%m-%d %H:%M')
+    meta['duration'] = last_record['ts'] - meta['start']
+    meta['first_pressure'] = first_record['pressure']
+    meta['last_pressure'] = last_record['pressure']
+    cached = load_cached_summary(reffile)
+    if cached is not None:
+        meta['point_count'], meta['min_pressure'] = cached
+    else:
+        tail_lines = [line for line in tail if line.strip()]
+        mean_line_length = sum(len(line) + 1 for line in tail_lines) / max(len(tail_lines), 1)
+        meta['point_count'] = max(len(tail_records), round((size - header_bytes) / mean_line_length))
+        meta['point_count_estimated'] = True
+    return meta
+
+def _get_refcurve_metadata_v2(reffile, meta):
+    # the records of v2 files can be counted and scanned without parsing
+    header, records = pumping_curve_v2.load(reffile)
+    meta['gauge_plugin'] = header.get('gauge_plugin')
+    meta['channel'] = header.get('channel')
+    meta['comment'] = header.get('comment') or ''
+    if header.get('pumping_started') is not None:
+        meta['start'] = header['pumping_started']
+    meta['point_count'] = len(records)
+    if not len(records):
+        return meta
+    if math.isnan(meta['start']):
+        meta['start'] = float(records['ts'][0])
+    meta['date'] = dt.fromtimestamp(meta['start']).strftime('%Y-%m-%d %H:%M')
+    meta['duration'] = float(records['ts'][-1]) - meta['start']
+    meta['first_pressure'] = float(records['pressure'][0])
+    meta['last_pressure'] = float(records['pressure'][-1])
+    meta['min_pressure'] = float(records['pressure'].min())
+    return meta
+
+def get_refcurves_metadata(root_directory='./data_v1.1.0', use_index=True):
+    if use_index and INDEX_FILENAME:
+        from refcurve_index import RefcurveIndex
+        try:
+            index_directory = os.path.dirname(INDEX_FILENAME)
+            if index_directory:
+                os.makedirs(index_directory, exist_ok=True)
+            index = RefcurveIndex(INDEX_FILENAME)
+        except (OSError, sqlite3.Error):
+            # no writable place for the index, fall back to a full scan
+            pass
+        else:
+            try:
+                index.update(root_directory)
+                return index.tree(root_directory)
+            except sqlite3.Error as e:
+                # e.g. locked by another instance for too long, fall back to a full scan
+                print("Could not use the index %s: %s" % (INDEX_FILENAME, e), file=sys.stderr)
+            finally:
+                index.close()
     data = []
     for path in os.scandir(root_directory):
         if path.is_dir():
@@ -25,9 +167,23 @@ def recurse_folder(root: os.DirEntry, top_root=''):
     for path in os.scandir(root):
         if path.is_dir():
             children.append(recurse_folder(path, top_root=os.path.join(top_root, root.name)))
-        if path.is_file() and path.name.endswith('.log'):
+        if path.is_file() and is_refcurve_filename(path.name):
             filename = os.path.join(top_root, os.path.join(root.name, path.name))
-            children.append({'filename': filename, 'date': 'date', 'name': path.name})
+            try:
+                meta = get_refcurve_metadata(filename)
+                # only if known already, parsing every log here would make the scan slow
+                milestones = get_stored_milestones(filename)
+            except read_errors() as e:
+                # a malformed record or a broken archive, keep the file in the tree without metadata
+                print("Could not read the metadata of %s: %r" % (filename, e), file=sys.stderr)
+                meta = {'filename': filename, 'name': path.name, 'date': ''}
+            else:
+                if milestones is not None:
+                    meta['milestones'] = dict(zip(MILESTONE_PRESSURES, milestones))
+            thumbnail = get_thumbnail(filename, mtime_ns=path.stat().st_mtime_ns)
+            if thumbnail:
+                meta['thumbnail'] = thumbnail
+            children.append(meta)
     children.sort(key=lambda x: x['name'])
     dirname = os.path.join(top_root, root.name)
     icon_path = os.path.join(dirname, 'icon.svg')
@@ -36,26 +192,463 @@ def recurse_folder(root: os.DirEntry, top_root=''):
         entry['icon'] = icon_path
     return entry
 
-def get_refcurve(name):
+def _cache_filename(filename, cache_directory, extension='.npz'):
+    key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+    return os.path.join(cache_directory, key + extension)
+
+def thumbnail_filename(filename, cache_directory=None):
+    """ where the cached thumbnail of filename goes, None if caching is disabled """
+    cache_directory = cache_directory or CACHE_DIRECTORY
+    if not cache_directory:
+        return None
+    return _cache_filename(filename, os.path.join(cache_directory, 'thumbnails'), extension='.png')
+
+def get_thumbnail(filename, mtime_ns=None, cache_directory=None):
+    """
+    Return the cached thumbnail of filename or None if there is none
+    for its current version. Thumbnails carry the mtime of their log
+    (see export_plots.py), pass mtime_ns if it's known already.
+    """
+    thumbnail = thumbnail_filename(filename, cache_directory)
+    if thumbnail is None:
+        return None
+    try:
+        if mtime_ns is None:
+            mtime_ns = os.stat(filename).st_mtime_ns
+        if os.stat(thumbnail).st_mtime_ns != mtime_ns:
+            return None
+    except OSError:
+        return None
+    return thumbnail
+
+def load_cached_refcurve(filename, cache_directory=None):
+    """
+    Return (timestamps, pressure, first_start) from the sidecar cache
+    or None if there is no cache entry matching the current size and
+    mtime of filename.
+    """
+    cache_directory = cache_directory or CACHE_DIRECTORY
+    if not cache_directory:
+        return None
+    stat = os.stat(filename)
+    try:
+        with np.load(_cache_filename(filename, cache_directory)) as cache:
+            if int(cache['size']) != stat.st_size or int(cache['mtime_ns']) != stat.st_mtime_ns:
+                return None
+            return cache['timestamps'], cache['pressure'], float(cache['pumping_started'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+def load_cached_summary(filename, cache_directory=None):
+    """
+    Return (point_count, min_pressure) from the sidecar cache, like
+    load_cached_refcurve() but without reading the curve itself.
+    min_pressure is None for an empty curve.
+    """
+    cache_directory = cache_directory or CACHE_DIRECTORY
+    if not cache_directory:
+        return None
+    stat = os.stat(filename)
+    try:
+        # members of an .npz are only read when accessed
+        with np.load(_cache_filename(filename, cache_directory)) as cache:
+            if int(cache['size']) != stat.st_size or int(cache['mtime_ns']) != stat.st_mtime_ns:
+                return None
+            min_pressure = float(cache['min_pressure'])
+            return int(cache['point_count']), None if math.isnan(min_pressure) else min_pressure
+    except (OSError, KeyError, ValueError):
+        return None
+
+def get_stored_milestones(filename, levels=MILESTONE_PRESSURES, cache_directory=None):
+    """
+    get_refcurve_milestones() without parsing the log: taken from the
+    sidecar cache or the records of a v2 file, None if not available.
+    """
+    if pumping_curve_v2.is_v2(filename):
+        return get_refcurve_milestones(filename, levels)
+    cache_directory = cache_directory or CACHE_DIRECTORY
+    if not cache_directory:
+        return None
+    stat = os.stat(filename)
+    try:
+        with np.load(_cache_filename(filename, cache_directory)) as cache:
+            if int(cache['size']) != stat.st_size or int(cache['mtime_ns']) != stat.st_mtime_ns:
+                return None
+            if not np.array_equal(cache['milestone_levels'], np.asarray(levels, dtype=np.float64)):
+                return None
+            return [None if math.isnan(t) else float(t) for t in cache['milestones']]
+    except (OSError, KeyError, ValueError):
+        return None
+
+def store_cached_refcurve(filename, timestamps, pressure, first_start, cache_directory=None, stat=None):
+    """
+    Write the parsed curve of filename to the sidecar cache.
+    Pass the os.stat() result taken *before* parsing as stat
+    so that a file growing meanwhile doesn't get a stale cache.
+    """
+    cache_directory = cache_directory or CACHE_DIRECTORY
+    if not cache_directory:
+        return
+    stat = stat or os.stat(filename)
+    cache_filename = _cache_filename(filename, cache_directory)
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        # write to a temporary file first so that readers never see a partial cache
+        fd, tmp_filename = tempfile.mkstemp(dir=cache_directory, suffix='.tmp')
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        pressure = np.asarray(pressure, dtype=np.float64)
+        levels = np.asarray(MILESTONE_PRESSURES, dtype=np.float64)
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f,
+                timestamps=timestamps,
+                pressure=pressure,
+                pumping_started=first_start,
+                point_count=len(pressure),
+                min_pressure=pressure.min() if len(pressure) else np.nan,
+                milestone_levels=levels,
+                milestones=time_to_pressure(_elapsed(timestamps, first_start), pressure, levels),
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns)
+        os.replace(tmp_filename, cache_filename)
+    except OSError:
+        # caching is an optimization only
+        pass
+
+def time_to_pressure(elapsed, pressure, levels):
+    """
+    The elapsed time at which pressure first drops to each of levels,
+    NaN for levels never reached. Samples before the start of pumping
+    (negative elapsed) are ignored, the crossing is interpolated
+    between the two samples around it in log-pressure.
+    """
+    elapsed = np.asarray(elapsed, dtype=np.float64)
+    pressure = np.asarray(pressure, dtype=np.float64)
+    levels = np.asarray(levels, dtype=np.float64)
+    after_start = elapsed >= 0
+    elapsed, pressure = elapsed[after_start], pressure[after_start]
+    result = np.full(len(levels), np.nan)
+    if not len(pressure):
+        return result
+    # the running minimum never increases, so the first crossing can be bisected
+    running_min = np.fmin.accumulate(pressure)
+    index = np.searchsorted(-running_min, -levels, side='left')
+    reached = index < len(pressure)
+    i = index[reached]
+    times = elapsed[i]
+    before = np.maximum(i - 1, 0)
+    p1, p2 = pressure[before], pressure[i]
+    interpolate = (i > 0) & (p1 > 0) & (p2 > 0) & (p1 > p2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = (np.log10(p1) - np.log10(levels[reached])) / (np.log10(p1) - np.log10(p2))
+    times = np.where(interpolate, elapsed[before] + fraction * (elapsed[i] - elapsed[before]), times)
+    result[reached] = times
+    return result
+
+def get_refcurve_milestones(filename, levels=MILESTONE_PRESSURES):
+    """ time_to_pressure() of the curve in filename as a list, None for levels never reached """
+    return refcurve_milestones(get_refcurve(filename), levels)
+
+def _elapsed(timestamps, start):
+    if len(timestamps) and math.isnan(start):
+        # no pumping_started record, count from the first sample
+        start = timestamps[0]
+    return timestamps - start
+
+def refcurve_milestones(rc, levels=MILESTONE_PRESSURES):
+    """ get_refcurve_milestones() for a loaded ReferenceCurve """
+    elapsed = _elapsed(rc.timestamps, rc.start)
+    return [None if math.isnan(t) else float(t) for t in time_to_pressure(elapsed, rc.pressure, levels)]
+
+def get_refcurve(name, cache_directory=None, pressure_dtype=np.float64):
+    """
+    Load the reference curve from the log file name.
+    Use pressure_dtype=np.float32 to halve the memory used by the pressure values.
+    """
     filename = name
-    with open(filename, 'r') as f:
-        content = f.read()
-    chunks = [json.loads(line) for line in content.split('\n') if line.strip().startswith('{')]
-    pressure_readings = [chunk for chunk in chunks if 'pressure' in chunk]
-    # only keep pressure_readings older than...
-    #pressure_readings = [pr for pr in pressure_readings if pr['ts'] < dt(2019, 9, 5, 22, 0).timestamp()]
-    timestamps = [pr['ts'] for pr in pressure_readings]
-    pressure = [pr['pressure'] for pr in pressure_readings]
-    starts = [chunk for chunk in chunks if 'action' in chunk and chunk['action'] == 'pumping_started']
-    first_start = starts[0]['ts'] if len(starts) else float('nan')
-    return ReferenceCurve(name=name, filename=filename, start=first_start, data=(timestamps, pressure))
-
-@attr.s
+    if pumping_curve_v2.is_v2(filename):
+        # memory-mapped, no parsing and no cache needed
+        header, records = pumping_curve_v2.load(filename)
+        first_start = header.get('pumping_started')
+        if first_start is None:
+            first_start = float('nan')
+        return ReferenceCurve(name=name, filename=filename, start=first_start,
+            timestamps=records['ts'], pressure=records['pressure'].astype(pressure_dtype, copy=False))
+    cached = load_cached_refcurve(filename, cache_directory=cache_directory)
+    if cached is not None:
+        timestamps, pressure, first_start = cached
+        return ReferenceCurve(name=name, filename=filename, start=first_start,
+            timestamps=timestamps, pressure=pressure.astype(pressure_dtype, copy=False))
+    stat = os.stat(filename)
+    timestamps, pressure, first_start = parse_refcurve(filename)
+    store_cached_refcurve(filename, timestamps, pressure, first_start, cache_directory=cache_directory, stat=stat)
+    return ReferenceCurve(name=name, filename=filename, start=first_start,
+        timestamps=timestamps, pressure=pressure.astype(pressure_dtype, copy=False))
+
+class GrowableArray:
+    """
+    A NumPy array that can be appended to with amortized O(1) cost.
+
+    The capacity doubles whenever it's exhausted, view() returns the
+    filled part without copying.
+    """
+
+    def __init__(self, dtype='float64', capacity=1024):
+        self._buffer = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, size):
+        if size <= len(self._buffer):
+            return
+        capacity = max(size, 2 * len(self._buffer))
+        buffer = np.empty(capacity, dtype=self._buffer.dtype)
+        buffer[:self._size] = self._buffer[:self._size]
+        self._buffer = buffer
+
+    def append(self, value):
+        self._reserve(self._size + 1)
+        self._buffer[self._size] = value
+        self._size += 1
+
+    def extend(self, values):
+        n = len(values)
+        self._reserve(self._size + n)
+        self._buffer[self._size:self._size + n] = values
+        self._size += n
+
+    def view(self):
+        return self._buffer[:self._size]
+
+# Records written by log_pumping_curve.py look like
+#   {"voltages": [...], "ts": 1567000000.0, "pressure": 0.001}
+#   {"ts": 1567000000.0, "pressure": 0.001}
+# and can be read without going through the json module.
+_FAST_RECORD = re.compile(r'\s*\{(?:"voltages": \[[^\]]*\], )?"ts": ([^,}]+), "pressure": ([^,}]+)\}\s*$')
+
+def _parse_lines(lines):
+    """
+    Parse lines of a log file.
+    Returns the timestamps and pressure values of the records
+    and the ts of the first pumping_started action (or None).
+    """
+    timestamps = []
+    pressure = []
+    first_start = None
+    match = _FAST_RECORD.match
+    for line in lines:
+        record = match(line)
+        if record:
+            try:
+                ts, p = float(record.group(1)), float(record.group(2))
+            except ValueError:
+                pass
+            else:
+                timestamps.append(ts)
+                pressure.append(p)
+                continue
+        line = line.strip()
+        if not line.startswith('{'):
+            continue
+        chunk = json.loads(line)
+        if 'pressure' in chunk:
+            timestamps.append(chunk['ts'])
+            pressure.append(chunk['pressure'])
+        if chunk.get('action') == 'pumping_started' and first_start is None:
+            first_start = chunk['ts']
+    return timestamps, pressure, first_start
+
+def parse_refcurve(filename, chunk_size=1 << 20):
+    """
+    Read the timestamps, pressure values and first pumping start from a log file.
+
+    The file is streamed in chunks of about chunk_size bytes, the values
+    go straight into NumPy buffers. Plain pressure records are picked
+    apart by a regular expression, only header and action lines need json.
+    """
+    timestamps = GrowableArray()
+    pressure = GrowableArray()
+    first_start = None
+    with open_refcurve(filename, 'r') as f:
+        while True:
+            lines = f.readlines(chunk_size)
+            if not lines:
+                break
+            chunk_timestamps, chunk_pressure, chunk_start = _parse_lines(lines)
+            if first_start is None:
+                first_start = chunk_start
+            timestamps.extend(chunk_timestamps)
+            pressure.extend(chunk_pressure)
+    if first_start is None:
+        first_start = float('nan')
+    return timestamps.view(), pressure.view(), first_start
+
+class RefcurveFollower:
+    """
+    Follow a log file that is still being written by log_pumping_curve.py.
+
+    Remembers how far the file has been read, read_new() parses
+    only the complete lines appended since the last call.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.offset = 0
+        self.start = float('nan')
+        self.restarts = 0
+        self._inode = None
+        self._v2_dtype = None
+
+    def has_new_data(self):
+        try:
+            return os.path.getsize(self.filename) != self.offset
+        except OSError:
+            return False
+
+    def read_new(self):
+        """
+        Returns the timestamps and pressure values appended since the last call.
+        If the file got truncated or replaced, reading starts over
+        and self.restarts is incremented.
+        """
+        with open(self.filename, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < self.offset or stat.st_ino != self._inode:
+                self.offset = 0
+                self.start = float('nan')
+                self.restarts += 1
+                self._inode = stat.st_ino
+                self._v2_dtype = None
+                if f.read(len(pumping_curve_v2.MAGIC)) == pumping_curve_v2.MAGIC:
+                    f.seek(0)
+                    header, self.offset = pumping_curve_v2.read_header(f)
+                    self._v2_dtype = pumping_curve_v2.record_dtype(header['fields'])
+                    if header.get('pumping_started') is not None:
+                        self.start = header['pumping_started']
+            f.seek(self.offset)
+            data = f.read()
+        if self._v2_dtype is not None:
+            # only take complete records
+            count = len(data) // self._v2_dtype.itemsize
+            self.offset += count * self._v2_dtype.itemsize
+            records = np.frombuffer(data, dtype=self._v2_dtype, count=count)
+            return records['ts'].copy(), records['pressure'].copy()
+        # leave an incomplete last line for the next call
+        data = data[:data.rfind(b'\n') + 1]
+        self.offset += len(data)
+        timestamps, pressure, first_start = _parse_lines(data.decode('utf-8', 'replace').splitlines())
+        if first_start is not None and math.isnan(self.start):
+            self.start = first_start
+        return np.array(timestamps, dtype=np.float64), np.array(pressure, dtype=np.float64)
+
+def _as_float64(values):
+    return np.asarray(values, dtype=np.float64)
+
+def _as_pressure(values):
+    values = np.asarray(values)
+    if values.dtype not in (np.float32, np.float64):
+        values = values.astype(np.float64)
+    return values
+
+@attr.s(slots=True, eq=False)
 class ReferenceCurve:
+    """
+    A pumping curve: float64 timestamps and float64 (or float32)
+    pressure values in contiguous arrays, plus a read-only view of
+    the time elapsed since the start of pumping.
+    """
     name: str = attr.ib()
     filename: str = attr.ib()
     start: float = attr.ib()
-    data: Tuple[List[float], List[float]] = attr.ib()
+    timestamps: np.ndarray = attr.ib(converter=_as_float64)
+    pressure: np.ndarray = attr.ib(converter=_as_pressure)
+    elapsed: np.ndarray = attr.ib(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self.elapsed = self.timestamps - self.start
+        self.elapsed.flags.writeable = False
+
+    @property
+    def data(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ (timestamps, pressure) as in former versions """
+        return self.timestamps, self.pressure
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + self.pressure.nbytes + self.elapsed.nbytes
+
+class RefcurveCache:
+    """
+    LRU cache of loaded ReferenceCurve objects, bounded by their total size.
+
+    Entries are checked against the size and mtime of their file
+    on every lookup and reloaded if the file has changed.
+    """
+
+    def __init__(self, max_bytes=500 * 2**20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, filename):
+        stat = os.stat(filename)
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry and entry[0] == key:
+                self._entries.move_to_end(filename)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        rc = get_refcurve(filename)
+        self._insert(filename, key, rc)
+        return rc
+
+    def _insert(self, filename, key, rc):
+        nbytes = rc.nbytes
+        with self._lock:
+            self._remove(filename)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[filename] = (key, rc, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, filename):
+        entry = self._entries.pop(filename, None)
+        if entry:
+            self._nbytes -= entry[2]
+
+    def invalidate(self, filename=None):
+        """ Drop filename (or everything) from the cache """
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+                self._nbytes = 0
+            else:
+                self._remove(filename)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries), 'nbytes': self._nbytes, 'max_bytes': self.max_bytes}
+
+# process-wide cache used by the GUI
+refcurve_cache = RefcurveCache(max_bytes=int(os.environ.get('REFCURVES_CACHE_MAX_BYTES', 500 * 2**20)))
 
 def main():
     print(get_refcurves_metadata())
@@ -0,0 +1,97 @@
+import math
+import random
+import time
+
+from gauge_plugin import Gauge, GaugeError
+
+class SimulatedGauge(Gauge):
+    """
+    A gauge without hardware: every channel follows a pump-down curve
+    (roughing phase, outgassing limited decay, ultimate pressure) with
+    multiplicative noise, optional pressure bursts and optional faults.
+
+    The options can also be given in the identifier as comma separated
+    key=value pairs, e.g. 'rate=1000,noise=0.05,faults=0.01', which
+    is how they are set from log_pumping_curve.py.
+
+    rate            readings per second at most, 0 for no limit
+    speed           simulated seconds per real second
+    noise           relative standard deviation of the readings
+    bursts          pressure bursts per simulated hour and channel
+    burst_height    pressure factor at the peak of a burst
+    burst_duration  decay time of a burst in simulated seconds
+    faults          probability of a GaugeError per get_readings() call
+    seed            seed of the random generator
+    """
+
+    OPTIONS = {'rate': float, 'speed': float, 'noise': float, 'bursts': float,
+               'burst_height': float, 'burst_duration': float, 'faults': float, 'seed': int}
+
+    def __init__(self, identifier='', channels=('1',), rate=0., speed=1., noise=0.02, bursts=0.,
+                 burst_height=10., burst_duration=30., faults=0., seed=None):
+        options = dict(rate=rate, speed=speed, noise=noise, bursts=bursts, burst_height=burst_height,
+                       burst_duration=burst_duration, faults=faults, seed=seed)
+        options.update(self.parse_identifier(identifier))
+        for name, value in options.items():
+            setattr(self, name, value)
+        self.selected_channels = list(channels)
+        self.random = random.Random(self.seed)
+        self.start = time.monotonic()
+        self.last_reading = None
+        self.last_elapsed = 0.
+        # active bursts per channel as (start, height) in simulated time
+        self.active_bursts = [[] for _ in self.selected_channels]
+
+    @classmethod
+    def parse_identifier(cls, identifier):
+        options = {}
+        for item in identifier.split(','):
+            if not item.strip():
+                continue
+            name, _, value = item.partition('=')
+            name = name.strip()
+            if name not in cls.OPTIONS:
+                raise ValueError('unknown option of the simulated gauge: %s' % name)
+            options[name] = cls.OPTIONS[name](value)
+        return options
+
+    def pressure(self, index, elapsed):
+        """ the noise free pump-down curve of channel index after elapsed seconds """
+        # later channels pump down a bit slower and to a higher ultimate pressure
+        tau = 60. * (1. + 0.5 * index)
+        return 1000. * math.exp(-elapsed / tau) + 1e-3 / (1. + elapsed / 600.) + 1e-8 * (1. + index)
+
+    def _burst_factor(self, index, elapsed, dt):
+        bursts = self.active_bursts[index]
+        if self.bursts > 0 and dt > 0 and self.random.random() < 1. - math.exp(-self.bursts * dt / 3600.):
+            bursts.append((elapsed, self.burst_height - 1.))
+        factor = 1.
+        for start, height in bursts:
+            factor += height * math.exp(-(elapsed - start) / self.burst_duration)
+        # forget bursts that have decayed below the noise
+        bursts[:] = [(start, height) for start, height in bursts
+                     if height * math.exp(-(elapsed - start) / self.burst_duration) > 1e-3]
+        return factor
+
+    def _wait_for_rate(self):
+        if self.rate > 0 and self.last_reading is not None:
+            delay = self.last_reading + 1. / self.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.last_reading = time.monotonic()
+
+    def get_readings(self):
+        self._wait_for_rate()
+        if self.faults > 0 and self.random.random() < self.faults:
+            raise GaugeError('simulated fault')
+        elapsed = (time.monotonic() - self.start) * self.speed
+        dt, self.last_elapsed = elapsed - self.last_elapsed, elapsed
+        pressures = []
+        for index in range(len(self.selected_channels)):
+            pressure = self.pressure(index, elapsed) * self._burst_factor(index, elapsed, dt)
+            pressures.append(pressure * math.exp(self.random.gauss(0., self.noise)))
+        return {'pressures': pressures}
+
+    def get_reading(self, channel):
+        index = self.selected_channels.index(channel)
+        return self.get_readings()['pressures'][index]
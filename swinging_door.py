@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""
+Swinging door compression of pumping curves in log-pressure space.
+
+The stored points, connected by straight lines in log(pressure) over
+time, deviate from every sampled point by at most the given relative
+error. Long plateaus collapse into a single line segment.
+
+Run this module to report the compression ratio and the maximum error
+for recorded curves.
+"""
+
+import math
+
+def deviation_from_percent(percent):
+    """ the log10 deviation corresponding to a relative error in percent """
+    return math.log10(1. + percent / 100.)
+
+class SwingingDoor:
+    """
+    Streaming swinging door compressor for a single channel.
+
+    Unlike the textbook algorithm, a segment only ends at a point whose
+    own slope from the anchor lies inside the door. That keeps the
+    error bound strict while only actual samples get stored.
+
+    add() takes the points in time order and returns the payloads of
+    the points to be stored (usually none, at times the one before).
+    Call flush() at the end to store the last point as well.
+    """
+
+    def __init__(self, deviation):
+        self.deviation = deviation
+        self.anchor = None
+        self.last = None
+        self.slope_upper = math.inf
+        self.slope_lower = -math.inf
+
+    def _store(self, point):
+        self.anchor = point
+        self.slope_upper = math.inf
+        self.slope_lower = -math.inf
+        return point[2]
+
+    def add(self, t, y, payload=None, force=False):
+        stored = []
+        point = (t, y, payload)
+        if self.anchor is None or not math.isfinite(y) or not math.isfinite(self.anchor[1]):
+            # the first point and non-finite values (e.g. log of 0) are always kept
+            if self.last is not None and self.last is not self.anchor:
+                stored.append(self._store(self.last))
+            stored.append(self._store(point))
+            self.last = point
+            return stored
+        dt = t - self.anchor[0]
+        if dt <= 0:
+            self.last = point
+            return stored
+        slope_upper = min(self.slope_upper, (y + self.deviation - self.anchor[1]) / dt)
+        slope_lower = max(self.slope_lower, (y - self.deviation - self.anchor[1]) / dt)
+        slope = (y - self.anchor[1]) / dt
+        if not slope_lower <= slope <= slope_upper:
+            # the door closed or a line to this point would leave the tolerance of
+            # an earlier one: the line anchor -> last point is the longest valid one
+            stored.append(self._store(self.last))
+            dt = t - self.anchor[0]
+            if dt > 0:
+                self.slope_upper = (y + self.deviation - self.anchor[1]) / dt
+                self.slope_lower = (y - self.deviation - self.anchor[1]) / dt
+        else:
+            self.slope_upper, self.slope_lower = slope_upper, slope_lower
+        self.last = point
+        if force and self.last is not self.anchor:
+            stored.append(self._store(self.last))
+        return stored
+
+    def flush(self):
+        """ store the last point if it hasn't been stored yet """
+        if self.last is not None and self.last is not self.anchor:
+            return [self._store(self.last)]
+        return []
+
+def compress(timestamps, pressure, deviation):
+    """ Returns the indices of the points kept by the swinging door """
+    door = SwingingDoor(deviation)
+    kept = []
+    for i, (t, p) in enumerate(zip(timestamps, pressure)):
+        y = math.log10(p) if p > 0 else -math.inf
+        kept.extend(door.add(t, y, payload=i))
+    kept.extend(door.flush())
+    return kept
+
+def max_error(timestamps, pressure, kept):
+    """ largest relative deviation (in percent) of the sampled points from the stored curve """
+    import numpy as np
+    timestamps = np.asarray(timestamps)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_pressure = np.log10(np.asarray(pressure))
+    kept = np.asarray(kept)
+    reconstructed = np.interp(timestamps, timestamps[kept], log_pressure[kept])
+    finite = np.isfinite(log_pressure)
+    if not finite.any():
+        return 0.
+    deviation = np.max(np.abs(reconstructed[finite] - log_pressure[finite]))
+    return (10. ** deviation - 1.) * 100.
+
+def main():
+    import argparse
+    from refcurves import get_refcurve
+    parser = argparse.ArgumentParser(description='Report swinging door compression of recorded curves')
+    parser.add_argument('--max-error', '-e', type=float, default=5., help='maximum relative error in percent')
+    parser.add_argument('logfile', nargs='+')
+    args = parser.parse_args()
+    deviation = deviation_from_percent(args.max_error)
+    for filename in args.logfile:
+        rc = get_refcurve(filename)
+        kept = compress(rc.timestamps, rc.pressure, deviation)
+        ratio = len(rc.pressure) / max(len(kept), 1)
+        error = max_error(rc.timestamps, rc.pressure, kept) if kept else 0.
+        print(f"{filename}: {len(rc.pressure)} -> {len(kept)} points, ratio {ratio:.1f}, max error {error:.2f} %")
+
+if __name__ == "__main__":
+    main()
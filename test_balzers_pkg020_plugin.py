@@ -0,0 +1,162 @@
+"""
+Tests of balzers_pkg020_plugin.py (and of logging its stream with
+log_pumping_curve.py) against a stub of labjack.ljm, so that neither
+the LJM library nor a LabJack is needed.
+
+    python -m unittest test_balzers_pkg020_plugin
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from balzerspkg020 import tables
+from balzerspkg020_helpers import interpolate_log_aware
+
+class LJMError(Exception):
+    pass
+
+class StubLJM(types.ModuleType):
+    """ records the calls of the plugin and answers them with canned values """
+
+    def __init__(self):
+        super().__init__('labjack.ljm')
+        self.ljm = types.ModuleType('labjack.ljm.ljm')
+        self.ljm.LJMError = LJMError
+        self.calls = []
+        self.values = {}
+        self.stream_blocks = []
+        self.actual_scan_rate = None
+        self.fail = False
+
+    def _call(self, name, *args):
+        self.calls.append((name,) + args)
+        if self.fail:
+            raise LJMError(name)
+
+    def openS(self, device_type, connection_type, identifier):
+        self._call('openS', device_type, connection_type, identifier)
+        return 7
+
+    def eReadNames(self, handle, num_frames, names):
+        self._call('eReadNames', handle, num_frames, list(names))
+        return [self.values[name] for name in names]
+
+    def eReadName(self, handle, name):
+        self._call('eReadName', handle, name)
+        return self.values[name]
+
+    def namesToAddresses(self, num_frames, names):
+        self._call('namesToAddresses', num_frames, list(names))
+        return [1000 + 2 * i for i in range(num_frames)], [3] * num_frames
+
+    def eStreamStart(self, handle, scans_per_read, num_addresses, addresses, scan_rate):
+        self._call('eStreamStart', handle, scans_per_read, num_addresses, list(addresses), scan_rate)
+        return self.actual_scan_rate or scan_rate
+
+    def eStreamRead(self, handle):
+        self._call('eStreamRead', handle)
+        if not self.stream_blocks:
+            raise LJMError('eStreamRead')
+        return self.stream_blocks.pop(0), 0, 0
+
+    def eStreamStop(self, handle):
+        self._call('eStreamStop', handle)
+
+def tpr2(voltage):
+    return interpolate_log_aware(voltage, tables['tpr2'])
+
+class BalzersPkg020Test(unittest.TestCase):
+
+    def setUp(self):
+        self.ljm = StubLJM()
+        labjack = types.ModuleType('labjack')
+        labjack.ljm = self.ljm
+        modules = mock.patch.dict(sys.modules, {'labjack': labjack, 'labjack.ljm': self.ljm})
+        modules.start()
+        self.addCleanup(modules.stop)
+        sys.modules.pop('balzers_pkg020_plugin', None)
+        import balzers_pkg020_plugin
+        self.plugin = balzers_pkg020_plugin
+        self.gauge = balzers_pkg020_plugin.BalzersPkg020(channels=['AIN0', 'AIN1', 'AIN2'])
+        self.ljm.calls.clear()
+
+    def test_get_readings_single_call(self):
+        self.ljm.values = {'AIN0': 1.5, 'AIN1': 4.25, 'AIN2': 9.}
+        readings = self.gauge.get_readings()
+        self.assertEqual(self.ljm.calls, [('eReadNames', 7, 3, ['AIN0', 'AIN1', 'AIN2'])])
+        self.assertEqual(readings['voltages'], [1.5, 4.25, 9.])
+        np.testing.assert_allclose(readings['pressures'], [tpr2(1.5), tpr2(4.25), tpr2(9.)], rtol=1e-12)
+
+    def test_get_reading_channel(self):
+        self.ljm.values = {'AIN0': 1.5, 'AIN1': 4.25, 'AIN2': 9.}
+        reading = self.gauge.get_reading('AIN1')
+        self.assertEqual(self.ljm.calls, [('eReadName', 7, 'AIN1')])
+        self.assertEqual(reading['voltage'], 4.25)
+        self.assertAlmostEqual(reading['pressure'], tpr2(4.25), delta=1e-12 * tpr2(4.25))
+
+    def test_errors_become_gauge_errors(self):
+        self.ljm.fail = True
+        with self.assertRaises(self.plugin.GaugeError):
+            self.gauge.get_readings()
+        with self.assertRaises(self.plugin.GaugeError):
+            self.gauge.get_reading('AIN0')
+
+    def test_stream(self):
+        # the device returns interleaved scans: AIN0, AIN1, AIN2, AIN0, ...
+        first = [0.5, 2., 6., 1., 3., 7.]
+        second = [1.5, 4., 8.]
+        self.ljm.stream_blocks = [first, second]
+        self.ljm.actual_scan_rate = 999.5
+        with mock.patch.object(self.plugin.time, 'time', return_value=1567000000.):
+            scan_rate = self.gauge.start_stream(scan_rate=1000., scans_per_read=2)
+        self.assertEqual(scan_rate, 999.5)
+        self.assertEqual(self.ljm.calls, [
+            ('namesToAddresses', 3, ['AIN0', 'AIN1', 'AIN2']),
+            ('eStreamStart', 7, 2, 3, [1000, 1002, 1004], 1000.),
+        ])
+
+        block = self.gauge.read_stream()
+        np.testing.assert_array_equal(block['voltages'], [[0.5, 2., 6.], [1., 3., 7.]])
+        np.testing.assert_allclose(block['ts'], [1567000000., 1567000000. + 1 / 999.5], rtol=0, atol=1e-9)
+        expected = [[tpr2(v) for v in scan] for scan in block['voltages']]
+        np.testing.assert_allclose(block['pressures'], expected, rtol=1e-12)
+
+        # timestamps continue from the scans read before
+        block = self.gauge.read_stream()
+        np.testing.assert_array_equal(block['voltages'], [[1.5, 4., 8.]])
+        np.testing.assert_allclose(block['ts'], [1567000000. + 2 / 999.5], rtol=0, atol=1e-9)
+        np.testing.assert_allclose(block['pressures'], [[tpr2(1.5), tpr2(4.), tpr2(8.)]], rtol=1e-12)
+
+        self.gauge.stop_stream()
+        self.assertEqual(self.ljm.calls[-1], ('eStreamStop', 7))
+        self.assertIsNone(self.gauge.stream_scan_rate)
+
+    def test_logger_captures_stream(self):
+        import log_pumping_curve
+        from refcurves import parse_refcurve
+        self.ljm.stream_blocks = [[0.5, 2., 6., 1., 3., 7.], [1.5, 4., 8.]]
+        self.ljm.actual_scan_rate = 999.5
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filenames = [os.path.join(tmpdir, 'ch%d.log' % i) for i in range(3)]
+            logger = log_pumping_curve.GaugeLogger(self.gauge, 'balzers', [('AIN0', ''), ('AIN1', ''), ('AIN2', '')],
+                filenames, writer_options={'fsync': False})
+            # ends after the two blocks, when the stub fails like a broken stream
+            asyncio.run(logger.capture_stream(1000., 60.))
+            logger.close()
+            self.assertEqual(self.ljm.calls[-1], ('eStreamStop', 7))
+            for i, filename in enumerate(filenames):
+                timestamps, pressure, _ = parse_refcurve(filename)
+                self.assertEqual(len(timestamps), 3)
+                np.testing.assert_allclose(np.diff(timestamps), 1 / 999.5, rtol=0, atol=1e-6)
+                voltages = [[0.5, 2., 6.], [1., 3., 7.], [1.5, 4., 8.]]
+                np.testing.assert_allclose(pressure, [tpr2(scan[i]) for scan in voltages], rtol=1e-12)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,34 +4,69 @@ from gauge_plugin import Gauge, GaugeError
 
 class VacomMvc3(Gauge):
 
-    def __init__(self, identifier='', channels=(1,2,3)):
+    terminator = b'\r'
+
+    def __init__(self, identifier='', channels=(1,2,3), timeout=0.5, pipelined=True):
         self.ser = serial.Serial(
             port=identifier,
             baudrate=19200,
             parity=serial.PARITY_NONE,
             stopbits=serial.STOPBITS_ONE,
-            bytesize=serial.EIGHTBITS
+            bytesize=serial.EIGHTBITS,
+            timeout=timeout
         )
         self.selected_channels = channels
+        self.timeout = timeout
+        # send the commands for all channels at once and collect the replies afterwards
+        self.pipelined = pipelined
+        self._buffer = bytearray(32 * max(len(channels), 1))
 
     def get_readings(self):
-        pressures = []
-        for channel in self.selected_channels:
-            pressures.append(self.get_reading(int(channel)))
-        return {'pressures': pressures}
+        channels = [int(channel) for channel in self.selected_channels]
+        if self.pipelined:
+            return {'pressures': self.query(channels)}
+        return {'pressures': [self.get_reading(channel) for channel in channels]}
 
     def get_reading(self, channel):
+        return self.query([channel])[0]
+
+    def query(self, channels):
+        """ read the pressure of each of the channels in one exchange """
         try:
-            read_command = b"RPV%d\r" % channel
-            self.ser.write(read_command)
-            time.sleep(.03)
-            pressure = ''
-            while self.ser.inWaiting() > 0:
-                pressure += self.ser.read(1).decode('ascii')
-
-            if pressure[0] == '0':
-                return float(pressure[3:-1])
-            else:
-                return float('nan')
-        except:
-            raise GaugeError()
+            self.ser.reset_input_buffer()
+            self.ser.write(b"".join(b"RPV%d\r" % channel for channel in channels))
+            replies = self._read_replies(len(channels))
+            return [self._parse_reply(reply) for reply in replies]
+        except GaugeError:
+            raise
+        except Exception as e:
+            raise GaugeError(str(e))
+
+    def _read_replies(self, count):
+        """ read until count terminators have arrived """
+        if len(self._buffer) < 32 * count:
+            self._buffer = bytearray(32 * count)
+        buffer = self._buffer
+        view = memoryview(buffer)
+        size = 0
+        terminators = 0
+        deadline = time.monotonic() + self.timeout * count
+        while terminators < count:
+            if size == len(buffer):
+                raise GaugeError('reply too long')
+            if time.monotonic() > deadline:
+                raise GaugeError('timeout waiting for the reply')
+            # block for the first byte (up to the timeout), then take whatever is waiting
+            chunk = max(1, min(self.ser.in_waiting, len(buffer) - size))
+            received = self.ser.readinto(view[size:size + chunk])
+            terminators += buffer.count(self.terminator, size, size + received)
+            size += received
+        return bytes(buffer[:size]).split(self.terminator)[:count]
+
+    @staticmethod
+    def _parse_reply(reply):
+        reply = reply.decode('ascii').strip()
+        if reply[0] == '0':
+            return float(reply[3:])
+        else:
+            return float('nan')